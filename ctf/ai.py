@@ -6,13 +6,22 @@
 """
 
 import math
-import pymunk
 from pymunk import Vec2d
 import gameobjects
+import planner
+import sight
 from collections import defaultdict, deque
 
 MIN_ANGLE_DIF = math.radians(5)
 
+# Steps of a move to the next tile of the path, see Ai.move
+NEW_MOVE, AIM, TURN, DRIVE, ARRIVED = range(5)
+
+# Cost of driving into a tile, for each box type. Wooden boxes have to be shot
+# and metal boxes pushed away, so they cost more than grass. Rock boxes are
+# not in the table since they can not be driven through.
+TILE_COSTS = {0: 1, 2: 3, 3: 10}
+
 
 def angle_between_vectors(vec1, vec2):
     """
@@ -30,98 +39,226 @@ def periodic_difference_of_angles(angle1, angle2):
 
 class Ai:
     """
-        A simple ai that finds the shortest path to the target using
-        a breadth first search. Also capable of shooting other tanks and or
+        A simple ai that finds the cheapest path to the target using
+        an A* search. Also capable of shooting other tanks and or
         wooden boxes.
     """
 
-    def __init__(self, tank,  game_objects_list, tanks_list, space, currentmap):
+    def __init__(self, tank,  game_objects, tanks_list, space, currentmap,
+                 flow_fields=None, tile_costs=TILE_COSTS, line_of_sight=None,
+                 path_planner=None):
+        """
+            flow_fields is an optional flowfield.FlowFields shared by all
+            the ai of the map, without it each ai searches its own paths.
+            tile_costs gives the cost of entering a tile for each box type.
+            line_of_sight is an optional sight.LineOfSight shared by all the
+            ai of the map, without it each ai has its own.
+            path_planner is an optional planner.PathPlanner whose workers
+            search the paths, it should be the one of the flow fields.
+        """
         self.tank               = tank
-        self.game_objects_list  = game_objects_list
+        self.game_objects       = game_objects
         self.tanks_list         = tanks_list
         self.space              = space
         self.currentmap         = currentmap
+        self.flow_fields        = flow_fields
+        self.tile_costs         = tile_costs
+        self.path_planner       = path_planner
+        if line_of_sight is None:
+            line_of_sight = sight.LineOfSight(space, currentmap, tanks_list)
+        self.line_of_sight      = line_of_sight
+        self.cost_grid          = currentmap.cost_grid(tile_costs)
+        self.map_version        = currentmap.version
         self.flag = None
-        self.MAX_X = currentmap.width - 1
-        self.MAX_Y = currentmap.height - 1
         self.last_distance = 1
 
+        # The planned path is kept between moves and only searched again
+        # when something invalidates it, see needs_new_path
         self.path = deque()
-        self.move_cycle = self.move_cycle_gen()
+        self.path_target = None   # The target tile the path leads to
+        self.path_valid = False
+        self.next_tile = None     # The tile the tank is driving to
+        # The search of the next path when it did not end in time or is
+        # done by the workers of the path planner, the tile it starts from,
+        # the target tile it leads to and the version of the map it reads
+        self.search = None
+        self.search_start = None
+        self.search_target = None
+        self.search_version = None
+        # The current move, kept as plain values so that it can be saved
+        # and restored (see snapshot.py)
+        self.move_step = NEW_MOVE
+        self.next_coord = None    # The centre of next_tile
+        self.angle_tank = 0
+        self.target_angle = 0
         self.update_grid_pos()
 
     def update_grid_pos(self):
         """
             This should only be called in the beginning, or at the
-            end of a move_cycle.
+            end of a move.
         """
         self.grid_pos = self.get_tile_of_position(self.tank.body.position)
 
-    def decide(self):
+    def decide(self, deadline=None):
         """
             Main decision function that gets called on every
-            tick of the game.
+            tick of the game. A path search still going on at the
+            time.perf_counter() deadline is carried over to the next call.
         """
         self.maybe_shoot()
-        next(self.move_cycle)
+        self.move(deadline)
 
         pass
 
     def maybe_shoot(self):
         """
-            Makes a raycast query in front of the tank. If another tank
-            or a wooden box is found, then we shoot.
-        """
-        res = self.space.segment_query_first((self.tank.body.position[0] - \
-              0.6 * math.sin(self.tank.body.angle), self.tank.body.position[1] +\
-              0.6 * math.cos(self.tank.body.angle)), (self.tank.body.position[0] -\
-              10*math.sin(self.tank.body.angle), self.tank.body.position[1] + \
-              10*math.cos(self.tank.body.angle)), 0, pymunk.ShapeFilter())
-        if res is not None:
-            try:
-                if hasattr(res, 'shape'):
-                    if isinstance(res.shape.parent, gameobjects.Tank):
-                        bullet = self.tank.shoot(self.space)
-                        if bullet is not None:
-                            self.game_objects_list.append(bullet)
-                    elif isinstance(res.shape.parent, gameobjects.Box):
-                        if res.shape.parent.boxmodel.destructable is True:
-                            bullet = self.tank.shoot(self.space)
-                            if bullet is not None:
-                                self.game_objects_list.append(bullet)
-            except:
-                pass
-
-    def move_cycle_gen(self):
-        """
-            A generator that iteratively goes through all the required
-            steps to move to our goal.
-        """
-        while True:
+            Looks at what is in front of the tank. If another tank or a
+            wooden box is found, then we shoot.
+        """
+        if self.tank.cooldown != 0:
+            # The tank can not shoot anyway
+            return
+        target = self.line_of_sight.first_hit(self.tank)
+        if isinstance(target, gameobjects.Tank) or \
+           (isinstance(target, gameobjects.Box) and
+                target.boxmodel.destructable is True):
+            bullet = self.tank.shoot(self.space)
+            if bullet is not None:
+                self.game_objects.add(bullet)
+
+    def move(self, deadline=None):
+        """
+            Goes on with the move to the next tile of the path, one step per
+            tick: a new move starts by taking the next tile of the path
+            (searched again if needed), then the tank aims and turns towards
+            it, and drives until it has passed its centre. If the search is
+            not over at the deadline, the tank waits on its tile and the
+            search goes on at the next move. With a path planner, the tank
+            follows its current path until the workers found the new one.
+        """
+        step = self.move_step
+        if step == ARRIVED:
+            step = NEW_MOVE
+        if step == NEW_MOVE:
             self.update_grid_pos()
-            path = self.find_shortest_path("without_metalbox")
-            if not path:
-                path = self.find_shortest_path("metalbox")
-                yield
-                if not path:
-                    continue
-            next_coord = path.pop()
-            next_coord += Vec2d(0.5, 0.5)
-            yield
-            target_angle = \
-            angle_between_vectors(Vec2d(self.tank.body.position), next_coord)
-            angle_tank = self.tank.body.angle
-            self.turn(angle_tank, target_angle)
-            while not self.correct_angle(angle_tank, target_angle):
-                angle_tank = self.tank.body.angle
-                target_angle = \
+            if self.search is not None and self.path_planner is None and \
+               self.get_target_tile().int_tuple != self.search_target:
+                # The target moved while the path was searched. The path of
+                # the workers is still taken, then searched again.
+                self.search = None
+            if self.search is None and self.needs_new_path():
+                self.search = self.path_search()
+                self.search_start = self.grid_pos.int_tuple
+                self.search_target = self.get_target_tile().int_tuple
+                self.search_version = self.currentmap.version
+            if self.search is not None:
+                if self.path_planner is not None:
+                    # Only looks if the workers are done
+                    path = planner.finish(self.search, 0)
+                else:
+                    path = planner.finish(self.search, deadline)
+                    if path is None:
+                        self.tank.stop_moving()
+                        self.move_step = NEW_MOVE
+                        return
+                if path is not None:
+                    self.search = None
+                    path = self.path_from_here(path, self.search_start)
+                if path is not None:
+                    self.path = path
+                    self.path_target = self.search_target
+                    # A path the workers searched before a box was destroyed
+                    # or moved is followed, but searched again at the next
+                    # move
+                    self.path_valid = \
+                        self.search_version == self.currentmap.version
+            if not self.path:
+                self.next_tile = None
+                self.move_step = NEW_MOVE
+                return
+            next_coord = self.path.pop()
+            self.next_tile = next_coord.int_tuple
+            self.next_coord = next_coord + Vec2d(0.5, 0.5)
+            self.move_step = AIM
+            return
+        if step == AIM:
+            self.target_angle = \
                 angle_between_vectors(Vec2d(self.tank.body.position),
-                                      next_coord)
-                yield
+                                      self.next_coord)
+            self.angle_tank = self.tank.body.angle
+            self.turn(self.angle_tank, self.target_angle)
+            step = TURN
+        if step == TURN:
+            if not self.correct_angle(self.angle_tank, self.target_angle):
+                self.angle_tank = self.tank.body.angle
+                self.target_angle = \
+                    angle_between_vectors(Vec2d(self.tank.body.position),
+                                          self.next_coord)
+                self.move_step = TURN
+                return
             self.tank.accelerate()
-            while not self.correct_pos(next_coord, self.last_distance):
-                yield
-            yield
+            # Start measuring from here, so that the move is only over once
+            # the tank has passed the centre of the next tile
+            self.last_distance = \
+                self.next_coord.get_distance(Vec2d(self.tank.body.position))
+        if self.correct_pos(self.next_coord, self.last_distance):
+            self.move_step = ARRIVED
+        else:
+            self.move_step = DRIVE
+
+    def needs_new_path(self):
+        """
+            Checks if the path has to be searched again: either it has been
+            invalidated (a box was destroyed or pushed, the tank respawned),
+            the target moved to another tile (the flag was picked up, dropped
+            or is carried around) or the tank drifted off the path.
+        """
+        if not self.path_valid:
+            return True
+        if self.get_target_tile().int_tuple != self.path_target:
+            return True
+        return self.next_tile is not None and \
+            self.grid_pos.int_tuple != self.next_tile
+
+    def invalidate_path(self):
+        """
+            Makes the ai search a new path before its next move. A search of
+            the workers of the path planner is not dropped, its path is
+            followed until a new one is found.
+        """
+        self.path_valid = False
+        if self.path_planner is None:
+            self.cancel_search()
+
+    def cancel_search(self):
+        """
+            Drops the path search going on, if any, its path is never used.
+            A search of the workers of the path planner still runs to its
+            end, but its result is ignored.
+        """
+        self.search = None
+        self.search_start = None
+        self.search_target = None
+        self.search_version = None
+
+    def boxes_changed(self):
+        """
+            Call this when a box of the map has been destroyed or moved, a
+            new path will be searched.
+        """
+        self.invalidate_path()
+
+    def respawned(self):
+        """
+            Call this when the tank has been moved back to its base, the
+            current move is abandoned and a new path will be searched.
+        """
+        self.tank.stop_moving()
+        self.tank.stop_turning()
+        self.next_tile = None
+        self.invalidate_path()
+        self.move_step = NEW_MOVE
 
     def correct_pos(self, target_pos, last_distance):
         """
@@ -162,38 +299,75 @@ class Ai:
         else:
             return False
 
-    def find_shortest_path(self, box_indicator):
-        """
-            A simple Breadth First Search using integer coordinates as our
-            nodes. Edges are calculated as we go, using an external function.
-        """
-        # To be implemented
-        dict = {}
-        shortest_path = []
-        visited = set()
-        queue = deque()
-        queue.append(self.grid_pos)
-        goal_node = None
-        while queue:
-            node = Vec2d(queue.popleft())
-            if node == self.get_target_tile().int_tuple:
-                goal_node = node.int_tuple
-                break
-            for neighbor in self.get_tile_neighbors(node, box_indicator):
-                neighbor = neighbor.int_tuple
-                if neighbor not in visited:
-                    queue.append(neighbor)
-                    visited.add(neighbor)
-                    dict[neighbor] = node.int_tuple
-        if goal_node is None:
-            return deque([])
+    def path_from_here(self, path, start):
+        """
+            Returns what is left of a path searched from the tile start, from
+            the tile of the tank, which may have moved on while the workers of
+            the path planner searched it. Returns None if the tank is not on
+            the path.
+        """
+        here = self.grid_pos.int_tuple
+        if here == start:
+            return path
+        while path:
+            if path.pop().int_tuple == here:
+                return path
+        return None
+
+    def get_path(self):
+        """ Returns the path to the target, see path_search. """
+        return planner.finish(self.path_search())
+
+    def path_search(self):
+        """
+            A generator that searches the path to the target, see
+            planner.finish. Every ai that goes for the flag reads its path
+            from the shared flow fields if there are any, while the ai
+            carrying the flag home searches its own path.
+        """
+        tile = self.grid_pos.int_tuple
+        target = self.get_target_tile().int_tuple
+        if self.flow_fields is not None and self.tank.flag is None:
+            width = self.currentmap.width
+            field = yield from self.flow_fields.search(target[1] * width
+                                                       + target[0])
+            return self.flow_fields.path(tile, target, field)
+        return (yield from self.shortest_path_search())
+
+    def find_shortest_path(self):
+        """ Returns the cheapest path to the target, see the search below. """
+        return planner.finish(self.shortest_path_search())
+
+    def shortest_path_search(self):
+        """
+            Searches the cheapest path to the target with an A* search (see
+            planner.shortest_path): entering a tile costs what tile_costs
+            gives for its box, so the path goes through boxes only when it is
+            worth it. It is a generator that pauses during the search, see
+            planner.finish. With a path planner the search is done by its
+            workers, and the generator pauses until they are done.
+        """
+        width = self.currentmap.width
+        if self.map_version != self.currentmap.version:
+            # Boxes have been destroyed or moved since the costs were computed
+            self.cost_grid = self.currentmap.cost_grid(self.tile_costs)
+            self.map_version = self.currentmap.version
+        start_x, start_y = self.grid_pos.int_tuple
+        goal_x, goal_y = self.get_target_tile().int_tuple
+        # Every tile costs at least the cheapest box type, which keeps the
+        # heuristic from overestimating
+        arguments = (self.cost_grid, width, self.currentmap.height,
+                     start_y * width + start_x, goal_y * width + goal_x,
+                     min(self.tile_costs.values()))
+        if self.path_planner is not None:
+            search = self.path_planner.submit(planner.shortest_path,
+                                              *arguments)
+            while not search.ready():
+                yield
+            tiles = search.get()
         else:
-            key = goal_node
-            while key != self.grid_pos.int_tuple:
-                shortest_path.append(Vec2d(key))
-                parent_node = dict[key]
-                key = parent_node
-            return deque(shortest_path)
+            tiles = yield from planner.shortest_path(*arguments)
+        return deque(Vec2d(tile % width, tile // width) for tile in tiles)
 
     def get_target_tile(self):
         """
@@ -213,11 +387,10 @@ class Ai:
             where it is when the Ai object is initialized.
         """
         if self.flag is None:
-            # Find the flag in the game objects list
-            for obj in self.game_objects_list:
-                if isinstance(obj, gameobjects.Flag):
-                    self.flag = obj
-                    break
+            # Find the flag in the game objects
+            for obj in self.game_objects.of_type(gameobjects.Flag):
+                self.flag = obj
+                break
         return self.flag
 
     def get_tile_of_position(self, position_vector):
@@ -228,51 +401,4 @@ class Ai:
         x, y = position_vector
         return Vec2d(int(x), int(y))
 
-    def get_tile_neighbors(self, coord_vec, box_indicator):
-        """
-            Returns all bordering grid squares of the input coordinate.
-            A bordering square is only considered accessible if it is grass
-            or a wooden box.
-        """
-        neighbors = []   # Find the coordinates of the tiles' four neighbors
-        neighbors.append(coord_vec + Vec2d(1, 0))
-        neighbors.append(coord_vec + Vec2d(-1, 0))
-        neighbors.append(coord_vec + Vec2d(0, 1))
-        neighbors.append(coord_vec + Vec2d(0, -1))
-        if box_indicator == "without_metalbox":
-            return filter(self.filter_tile_neighbors, neighbors)
-        else:
-            return filter(self.filter_tile_neighbors_metalbox, neighbors)
-
-    def filter_tile_neighbors(self, coord):
-        """
-            Filter for all the tiles around the tank. This filter removes
-            the immovable stones so we don't count those tiles to find the
-            shortest path.
-        """
-        coord = coord.int_tuple
-        if coord[1] <= self.MAX_Y and coord[0] <= self.MAX_X and coord[1] >= \
-           0 and coord[0] >=\
-           0 and (self.currentmap.boxAt(coord[0], coord[1])
-                  == 0 or self.currentmap.boxAt(coord[0], coord[1]) == 2):
-            return True
-        return False
-
-    def filter_tile_neighbors_metalbox(self, coord):
-        """
-            Filter for all the tiles around the tank, metalboxes included.  This
-            filter removes the immovable stones so we don't count those tiles to
-            find the shortest path.
-        """
-        coord = coord.int_tuple
-        if coord[1] <= self.MAX_Y and coord[0] <= self.MAX_X and coord[1] >=\
-           0 and coord[0] >= 0 and (self.currentmap.boxAt(coord[0], coord[1])
-                                    == 0 or self.currentmap.boxAt(coord[0],
-                                                                  coord[1])
-                                    == 2 or self.currentmap.boxAt(coord[0],
-                                                                  coord[1])
-                                    == 3):
-            return True
-        return False
-
 SimpleAi = Ai # Legacy
@@ -0,0 +1,49 @@
+"""
+    The file contains the lazy loading of the assets of the game (images,
+    sounds and maps): an asset is only loaded the first time it is used and
+    then kept, so a match only loads what it uses.
+"""
+
+
+class LazyList:
+    """
+        A list of assets, each one loaded by its loader the first time it is
+        read. For instance the tanks of the six colors, when a map only has
+        two start positions.
+    """
+
+    def __init__(self, loaders):
+        self.loaders        = loaders
+        self.items          = [None] * len(loaders)
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def __getitem__(self, index):
+        item = self.items[index]
+        if item is None:
+            item = self.loaders[index]()
+            self.items[index] = item
+        return item
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def lazy_module(module_globals, loaders):
+    """
+        Returns the __getattr__ function of a module whose assets are given
+        by loaders, a dictionary from the name of an asset to the function
+        that loads it. The asset is loaded when its name is first read from
+        the module and stored in the module, so it is only loaded once.
+    """
+    def __getattr__(name):
+        loader = loaders.get(name)
+        if loader is None:
+            raise AttributeError("module %r has no attribute %r"
+                                 % (module_globals["__name__"], name))
+        asset = loader()
+        module_globals[name] = asset
+        return asset
+    return __getattr__
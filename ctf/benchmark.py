@@ -0,0 +1,344 @@
+"""
+    The file contains the benchmarks of the game. It measures:
+    - the ticks per second of the game on every map, with and without
+      drawing the frames,
+    - the time Ai.find_shortest_path takes on maps of several sizes and
+      densities of boxes,
+    - the time GameObject.update_screen takes for each kind of object,
+    - the time a step of the physics engine takes with bullets in flight,
+    - the time to load large maps from the text and the compiled format.
+    The results are printed as JSON, and can be saved to be compared with
+    the results of a later version of the game.
+
+    Example: python3 benchmark.py --output baseline.json
+             python3 benchmark.py --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import runpy
+import statistics
+import sys
+import tempfile
+import time
+
+main_dir = os.path.split(os.path.abspath(__file__))[0]
+
+MAPS = ["map0", "map1", "map2"]
+MAP_SIZES = [10, 20, 40, 80]          # Width and height of the path maps
+BOX_DENSITIES = [0.0, 0.15, 0.3]      # Share of the tiles with a box
+BULLET_COUNTS = [0, 10, 50, 200]      # Bullets in flight during a step
+MAP_LOAD_SIZES = [100, 500, 1000]     # Width and height of the loaded maps
+TIME_PER_MEASURE = 0.5   # Seconds spent repeating a measure, at least
+
+
+def result(value, unit, better):
+    """
+        Returns a result of a benchmark, better tells if the value is better
+        when it is "higher" or "lower".
+    """
+    return {"value": value, "unit": unit, "better": better}
+
+
+def repeat(function):
+    """
+        Calls function until TIME_PER_MEASURE seconds have passed (at least
+        5 times) and returns the median time of a call, in seconds.
+    """
+    times = []
+    start = time.perf_counter()
+    while len(times) < 5 or time.perf_counter() - start < TIME_PER_MEASURE:
+        before = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - before)
+    return statistics.median(times)
+
+
+def init_display():
+    """
+        Opens a display that is not shown, the images of the game can only
+        be loaded once pygame has a display.
+    """
+    import pygame
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+
+def load_match(map_name):
+    """
+        Sets up a headless match of ctf.py on a map and returns the global
+        variables of ctf.py. The match is set up but not played.
+    """
+    sys.argv = ["ctf.py", "--headless", "--map", map_name, "--ticks", "0"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return runpy.run_path(os.path.join(main_dir, "ctf.py"))
+
+
+# -- The benchmarks, each one runs in its own process
+
+def ticks_per_second(map_name, ticks, render):
+    """ Plays ticks ticks of a match, drawing a frame after each if render. """
+    game = load_match(map_name)
+    game_tick = game["game_tick"]
+    game_objects = game["game_objects"]
+    game_renderer = None
+    if render:
+        import renderer
+        game_renderer = renderer.Renderer(game["screen"],
+                                          game["create_background"](),
+                                          space=game["space"])
+    start = time.perf_counter()
+    # Captured flags print the score
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(ticks):
+            if render:
+                game_renderer.save_states(game_objects)
+            game_tick()
+            if render:
+                game_renderer.draw(game_objects)
+                game_renderer.present()
+    return {"ticks_per_second/%s/%s" % (map_name,
+                                        "render" if render else "headless"):
+            result(ticks / (time.perf_counter() - start), "ticks/s",
+                   "higher")}
+
+
+def find_shortest_path(size, density):
+    """
+        Searches the path across a square map with randomly placed boxes,
+        from one corner to the opposite one.
+    """
+    init_display()
+    import pymunk
+    import ai
+    import entities
+    import gameobjects
+    import images
+    import maps
+    rng = random.Random(size * 100 + int(density * 100))
+    boxes = [[rng.choice((1, 2, 3)) if rng.random() < density else 0
+              for x in range(size)] for y in range(size)]
+    boxes[0][0] = 0
+    boxes[size - 1][size - 1] = 0
+    current_map = maps.Map(size, size, boxes, [(0.5, 0.5, 0)],
+                           (size - 0.5, size - 0.5))
+    space = pymunk.Space()
+    game_objects = entities.EntityRegistry()
+    tank = gameobjects.Tank(0.5, 0.5, 0, images.tanks[0], space)
+    game_objects.add(gameobjects.Flag(size - 0.5, size - 0.5))
+    ai_player = ai.Ai(tank, game_objects, [tank], space, current_map)
+    seconds = repeat(ai_player.find_shortest_path)
+    return {"find_shortest_path/%dx%d/density_%.2f" % (size, size, density):
+            result(seconds * 1e6, "us", "lower")}
+
+
+def update_screen():
+    """
+        Draws each kind of object of a match, with the same orientation
+        every time (the rotated sprite is then in the cache) and with a new
+        orientation every time.
+    """
+    game = load_match("map0")
+    import gameobjects
+    screen = game["screen"]
+    tank = game["tanks_list"][0]
+    objects = {"tank": tank,
+               "box": game["movable_box_list"][0],
+               "bullet": tank.shoot(game["space"]),
+               "flag": game["flag"],
+               "base": game["game_objects"].of_type(
+                   gameobjects.GameVisibleObject)[0]}
+    results = {}
+    for name, obj in objects.items():
+        seconds = repeat(lambda: [obj.update_screen(screen)
+                                  for i in range(100)]) / 100
+        results["update_screen/%s/same_angle" % name] = \
+            result(seconds * 1e6, "us", "lower")
+        angles = iter(range(10 ** 9))
+
+        def rotating():
+            for i in range(100):
+                obj.update_screen(screen, None, next(angles) * 7 % 360)
+        seconds = repeat(rotating) / 100
+        results["update_screen/%s/new_angle" % name] = \
+            result(seconds * 1e6, "us", "lower")
+    return results
+
+
+def space_step(count):
+    """
+        Steps the physics engine of a match on map0 with count bullets in
+        flight. The bullets that hit something are replaced before the next
+        step, out of the measure.
+    """
+    game = load_match("map0")
+    import images
+    import gameobjects
+    space = game["space"]
+    game_objects = game["game_objects"]
+    bullet_pool = game["bullet_pool"]
+    current_map = game["current_map"]
+    rng = random.Random(count)
+    free_tiles = [(x, y) for y in range(current_map.height)
+                  for x in range(current_map.width)
+                  if current_map.boxAt(x, y) == 0]
+    times = []
+    start = time.perf_counter()
+    while len(times) < 20 or time.perf_counter() - start < TIME_PER_MEASURE:
+        bullets = game_objects.of_type(gameobjects.Bullet)
+        for i in range(count - len(bullets)):
+            x, y = rng.choice(free_tiles)
+            angle = rng.uniform(0, 2 * math.pi)
+            bullet = bullet_pool.acquire(
+                x + rng.random(), y + rng.random(), angle,
+                images.rotate(images.bullet, math.degrees(-angle)))
+            game_objects.add(bullet)
+        for bullet in game_objects.of_type(gameobjects.Bullet):
+            bullet.update()
+        before = time.perf_counter()
+        space.step(1 / 50)
+        times.append(time.perf_counter() - before)
+    return {"space_step/bullets_%d" % count:
+            result(statistics.median(times) * 1e6, "us", "lower")}
+
+
+def load_map(size):
+    """
+        Reads a square map with randomly placed boxes from the text format,
+        and loads it from the compiled format.
+    """
+    import maps
+    rng = random.Random(size)
+    with tempfile.TemporaryDirectory() as directory:
+        text = os.path.join(directory, "map.txt")
+        with open(text, "w") as file_handle:
+            file_handle.write("%d %d\n" % (size, size))
+            for y in range(size):
+                file_handle.write(" ".join(str(rng.choice((0, 0, 1, 2, 3)))
+                                           for x in range(size)) + "\n")
+            file_handle.write("0.5 0.5 0\n%d.5 %d.5 180\n%d.5 %d.5\n"
+                              % (size - 1, size - 1, size // 2, size // 2))
+        compiled = maps.compilemap(text)
+        results = {}
+        for name, function, path in (("text", maps.readmap, text),
+                                     ("compiled", maps.loadmap, compiled)):
+            seconds = repeat(lambda: function(path))
+            results["load_map/%dx%d/%s" % (size, size, name)] = \
+                result(seconds * 1e6, "us", "lower")
+    return results
+
+
+def run(task):
+    """ Runs a benchmark given as (function name, arguments). """
+    name, arguments = task
+    return globals()[name](*arguments)
+
+
+def compare(results, baseline, threshold):
+    """
+        Compares the results with the ones of a baseline. Returns for each
+        result found in both the relative change and whether it is a
+        regression, that is worse by more than threshold.
+    """
+    comparison = {}
+    for name, new in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None or not old["value"]:
+            continue
+        change = new["value"] / old["value"] - 1
+        if new["better"] == "higher":
+            regression = change < -threshold
+        else:
+            regression = change > threshold
+        comparison[name] = {"baseline": old["value"], "value": new["value"],
+                            "change": change, "regression": regression}
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the speed of the "
+                                     "game and compares it with a baseline.")
+    parser.add_argument("--ticks", type=int, default=2000,
+                        help="Ticks played on each map (default 2000).")
+    parser.add_argument("--only", default=None,
+                        help="Only keep the results whose name starts with "
+                             "this, like find_shortest_path/40x40.")
+    parser.add_argument("--output", default=None,
+                        help="Write the results as JSON to this file, to use "
+                             "it later as a baseline.")
+    parser.add_argument("--compare", metavar="BASELINE", default=None,
+                        help="Compare the results with a file written by "
+                             "--output, the exit status is 1 on a "
+                             "regression.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="How much worse than the baseline a result has "
+                             "to be to count as a regression (default 0.1, "
+                             "10%%).")
+    args = parser.parse_args()
+
+    tasks = []
+    for map_name in MAPS:
+        for render in (False, True):
+            tasks.append(("ticks_per_second", (map_name, args.ticks, render)))
+    for size in MAP_SIZES:
+        for density in BOX_DENSITIES:
+            tasks.append(("find_shortest_path", (size, density)))
+    tasks.append(("update_screen", ()))
+    for count in BULLET_COUNTS:
+        tasks.append(("space_step", (count,)))
+    for size in MAP_LOAD_SIZES:
+        tasks.append(("load_map", (size,)))
+    if args.only is not None:
+        tasks = [task for task in tasks
+                 if task[0] == args.only.split("/")[0]]
+
+    # The images need a display, and ctf.py and the modules it imports load
+    # their files from this folder
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.chdir(main_dir)
+    results = {}
+    # One benchmark at a time so that they do not slow each other down, each
+    # in a new process since a match changes the modules it uses
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for task_results in pool.imap(run, tasks):
+            for name, value in task_results.items():
+                print("%-45s %12.1f %s" % (name, value["value"],
+                                           value["unit"]), file=sys.stderr)
+            results.update(task_results)
+    if args.only is not None:
+        results = {name: value for name, value in results.items()
+                   if name.startswith(args.only)}
+
+    report = {"results": results,
+              "python": platform.python_version(),
+              "machine": platform.platform()}
+    regressions = []
+    if args.compare is not None:
+        with open(args.compare) as file_handle:
+            baseline = json.load(file_handle)["results"]
+        report["comparison"] = compare(results, baseline, args.threshold)
+        for name, change in report["comparison"].items():
+            if change["regression"]:
+                regressions.append(name)
+                print("Regression: %s is %+.1f%% (%.1f, was %.1f)"
+                      % (name, change["change"] * 100, change["value"],
+                         change["baseline"]), file=sys.stderr)
+    text = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as file_handle:
+            file_handle.write(text)
+    print(text)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
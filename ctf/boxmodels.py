@@ -13,17 +13,26 @@ class BoxModel:
         the type of box, whether it can be moved, destroyed and the sprite.
     """
 
-    def __init__(self, sprite, movable, destructable):
-        self.sprite         = sprite
+    def __init__(self, image, movable, destructable, box_type):
+        self.image          = image   # The name of the sprite in images
         self.movable        = movable
         self.destructable   = destructable
+        self.box_type       = box_type   # The number of the box in the maps
 
+    @property
+    def sprite(self):
+        """ The sprite of the box, loaded when a box of the model is made. """
+        return getattr(images, self.image)
 
-woodbox  = BoxModel(images.woodbox,  movable=True, destructable=True)
 
-metalbox = BoxModel(images.metalbox, movable=True, destructable=False)
+woodbox  = BoxModel("woodbox",  movable=True, destructable=True,
+                    box_type=2)
 
-rockbox  = BoxModel(images.rockbox, movable=False, destructable=False)
+metalbox = BoxModel("metalbox", movable=True, destructable=False,
+                    box_type=3)
+
+rockbox  = BoxModel("rockbox", movable=False, destructable=False,
+                    box_type=1)
 
 
 def get_model(type):
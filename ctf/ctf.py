@@ -1,5 +1,96 @@
 """The file contains a while loop that runs the game and different setups."""
 
+import argparse
+import os
+import random
+import sys
+
+# ----- Command line -----#
+parser = argparse.ArgumentParser(description="Capture the flag.")
+parser.add_argument("--singleplayer", action="store_true",
+                    help="One player against the ai (default).")
+parser.add_argument("--hot--multiplayer", dest="hot_multiplayer",
+                    action="store_true",
+                    help="Two players on the same keyboard against the ai.")
+parser.add_argument("--headless", action="store_true",
+                    help="Run without a window and as fast as possible, "
+                         "every tank is then controlled by the ai.")
+parser.add_argument("--full-redraw", dest="full_redraw", action="store_true",
+                    help="Redraw the whole screen on every frame instead of "
+                         "only the parts that changed.")
+parser.add_argument("--tick-rate", dest="tick_rate", type=int, default=50,
+                    help="Number of ticks of the game per second, the game "
+                         "is tuned for 50.")
+parser.add_argument("--framerate", type=int, default=60,
+                    help="Maximum number of frames drawn per second.")
+parser.add_argument("--window-size", dest="window_size", type=int, nargs=2,
+                    metavar=("WIDTH", "HEIGHT"), default=None,
+                    help="Largest size of the window in pixels (default the "
+                         "size of the desktop), larger maps scroll.")
+parser.add_argument("--map", default="map0",
+                    help="The map to play on: map0, map1, map2, the name of "
+                         "another map of the ctf folder or the path of a map "
+                         "file (.txt or compiled .map).")
+parser.add_argument("--seed", type=int, default=None,
+                    help="Seed of the small random changes to the start of "
+                         "the match, without it every match starts the same.")
+parser.add_argument("--ticks", type=int, default=None,
+                    help="Stop after this many ticks of the game.")
+parser.add_argument("--rounds", type=int, default=None,
+                    help="Stop after this many captured flags.")
+parser.add_argument("--record", metavar="FILE", default=None,
+                    help="Record the match in a replay file.")
+parser.add_argument("--replay", metavar="FILE", default=None,
+                    help="Play a recorded match again, as fast as possible "
+                         "with --headless.")
+parser.add_argument("--seek", metavar="TICK", type=int, default=0,
+                    help="Start the replay at this tick.")
+parser.add_argument("--timings", metavar="FILE", default=None,
+                    help="Write how long each phase of every frame takes to "
+                         "a CSV file, or JSON lines if FILE ends with .jsonl. "
+                         "F3 shows the percentiles over the game.")
+parser.add_argument("--score-timeout", dest="score_timeout", metavar="SECONDS",
+                    type=float, default=None,
+                    help="Leave the score screen by itself after this many "
+                         "seconds instead of waiting for h.")
+parser.add_argument("--ai-budget", dest="ai_budget", metavar="MS", type=float,
+                    default=None,
+                    help="Milliseconds the ai may spend on each tick, the "
+                         "decisions and path searches that do not fit go on "
+                         "at the next ticks (default no limit). Can not be "
+                         "used with --record or --replay.")
+parser.add_argument("--ai-workers", dest="ai_workers", metavar="N", type=int,
+                    default=0,
+                    help="Search the paths of the ai in N worker processes, "
+                         "the ai follow their current path until the new one "
+                         "is found (default 0, searched in the game). Can "
+                         "not be used with --record or --replay.")
+args = parser.parse_args()
+for option, value in (("--ai-budget", args.ai_budget is not None),
+                      ("--ai-workers", args.ai_workers > 0)):
+    if value and (args.record or args.replay):
+        parser.error("%s makes the ai depend on the speed of the computer, "
+                     "a match played with it can not be replayed" % option)
+
+# -- The workers that search the paths of the ai, see --ai-workers. They are
+# started before pygame, so that they are not forked from its threads.
+import planner
+path_planner = None
+if args.ai_workers > 0:
+    try:
+        path_planner = planner.PathPlanner(args.ai_workers)
+    except ValueError:
+        parser.error("--ai-workers needs to fork processes, which this "
+                     "system can not do")
+
+headless = args.headless
+
+if headless:
+    # pygame still needs a display to convert the images, the dummy drivers
+    # provide one without opening a window or a sound device.
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+
 import pygame
 from pygame.locals import *
 from pygame.color import *
@@ -21,77 +112,135 @@ space.gravity = (0.0,  0.0)
 # -- Import from the ctf framework
 import ai
 import boxmodels
+import entities
+import flowfield
 import images
 import gameobjects
 import maps
-import sys
+import renderer
+import replay
+import scheduler
+import scorescreen
+import sight
+import snapshot
 import sound
+import timing
 import math
 
+# -- A replay sets up the match the way it was recorded
+replay_file = None
+if args.replay is not None:
+    replay_file = replay.Replay(args.replay)
+    args.map = replay_file.header.map
+    args.seed = replay_file.header.seed
+    args.tick_rate = replay_file.header.tick_rate
+    args.singleplayer = replay_file.header.player_mode == "singleplayer"
+    args.hot_multiplayer = \
+        replay_file.header.player_mode == "hot multiplayer"
+
+# Whether every tank is controlled by the ai, the players of a replay are
+# controlled by the recorded actions even in headless mode
+all_ai = headless if replay_file is None else replay_file.header.all_ai
+
 player_mode = ""
 
-if sys.argv[1] == "--singleplayer":
-    player_mode = "singleplayer"
-elif sys.argv[1] == "--hot--multiplayer":
+if args.hot_multiplayer:
     player_mode = "hot multiplayer"
+elif args.singleplayer:
+    player_mode = "singleplayer"
 
 # -- Constants
-FRAMERATE = 50
+TICK_RATE = args.tick_rate   # Ticks of the game per second
+FRAMERATE = args.framerate   # Maximum number of frames drawn per second
+MAX_CATCH_UP = 5   # Maximum number of ticks run before drawing a frame
+START_JITTER = 5   # Maximum change of the start orientations, in degrees
 
 # pygame.mixer.Sound.play(sound.b_music)
 
 # -- Variables
 #   Define the current level
-current_map         = maps.map0
+current_map         = maps.load(args.map)
+
+#   Random numbers of the match, see --seed
+rng                 = random.Random(args.seed)
 
-#   List of all game objects
-game_objects_list   = []
+#   Registry of all game objects
+game_objects        = entities.EntityRegistry()
 tanks_list          = []
 
 ai_list = []
 game_score = []
 
-# -- Resize the screen to the size of the current level
-screen = pygame.display.set_mode(current_map.rect().size)
-
-# -- Generate the background
-background = pygame.Surface(screen.get_size())
+# -- Resize the screen to the size of the current level, the window is at
+# most the size of the desktop and a larger level scrolls
+window_size = args.window_size or pygame.display.get_desktop_sizes()[0]
+screen = pygame.display.set_mode(
+    (min(current_map.rect().width, window_size[0]),
+     min(current_map.rect().height, window_size[1])))
 
 # Collision types on objects
 collision_type = {"bullet": 1, "tank": 2, "boxes": 3, "Indestrucatble_box": 4}
 
-#   Copy the grass tile all over the level area
-for x in range(0, current_map.width):
-    for y in range(0,  current_map.height):
-        background.blit(images.grass,  (x*images.TILE_SIZE,
-                                        y*images.TILE_SIZE))
-
 # -- Create the boxes
-box_list = []
-
-
-def create_boxes():
-    """A function that creates boxes."""
-    box_list.clear()
-    for x in range(0, current_map.width):
-        for y in range(0,  current_map.height):
-            # Get the type of boxes
-            box_type = current_map.boxAt(x, y)
-            box_model = boxmodels.get_model(box_type)
-            # If the box model is non null, create a box
-            if(box_model is not None):
-                # Create a "Box" using the model "box_model" at the
-                # coordinate (x,y) (an offset of 0.5 is added since
-                # the constructor of the Box object expects to know
-                # the centre of the box, have a look at the coordinate
-                # systems section for more explanations).
-                box = gameobjects.Box(x + 0.5, y + 0.5, box_model, space)
-                game_objects_list.append(box)
-                box_list.append(box)
+# Boxes that can never move (rock boxes), they are drawn on the background
+# instead of being among the game objects
+static_box_list = []
+# Boxes that can be moved or destroyed, including the destroyed ones
+movable_box_list = []
 
 
+def create_boxes(static=False):
+    """
+        A function that creates boxes. The immovable boxes are only created
+        if static is True, since they are never destroyed nor moved.
+    """
+    for x, y, box_type in current_map.tiles_with_box():
+        # Get the model of the box type
+        box_model = boxmodels.get_model(box_type)
+        # If the box model is non null, create a box
+        if(box_model is not None and box_model.movable != static):
+            # Create a "Box" using the model "box_model" at the
+            # coordinate (x,y) (an offset of 0.5 is added since
+            # the constructor of the Box object expects to know
+            # the centre of the box, have a look at the coordinate
+            # systems section for more explanations).
+            box = gameobjects.Box(x + 0.5, y + 0.5, box_model, space)
+            if static:
+                static_box_list.append(box)
+            else:
+                movable_box_list.append(box)
+                game_objects.add(box)
+
+
+create_boxes(static=True)
 create_boxes()
 
+
+def reset_boxes():
+    """
+        A function that puts the movable boxes back as they were at the start
+        of the round: the pushed boxes are moved back and the destroyed ones
+        are put back in the game, the boxes themselves are kept.
+    """
+    for box in movable_box_list:
+        box.reset()
+        if box not in game_objects:
+            space.add(box.body, box.shape)
+    # The destroyed boxes are drawn at their place again
+    game_objects.restore(movable_box_list)
+    current_map.reset_boxes()
+    boxes_changed()
+
+
+def create_background():
+    """
+        Generates the background: the grass tiles with the immovable boxes
+        on top of them. It only has to be created again when the map
+        changes, the parts of it are drawn when they are first seen.
+    """
+    return renderer.Background(current_map.rect().size, static_box_list)
+
+
 # Barrier
 static_body = space.static_body
 static_lines = [pymunk.Segment(static_body, (0, 0), (0, current_map.height),
@@ -109,28 +258,45 @@ for line in static_lines:
 
 space.add(static_lines)
 
+# -- Paths to the targets of the ai, shared by all of them
+flow_fields = flowfield.FlowFields(current_map, ai.TILE_COSTS, path_planner)
+
+# -- What the tanks have in their line of fire, shared by all the ai
+line_of_sight = sight.LineOfSight(space, current_map, tanks_list)
+
+# -- Bullets that hit something are kept here to be shot again
+bullet_pool = gameobjects.BulletPool(space)
+
 # -- Create the tanks
 player_tank = None
 scnd_player_tank = ""
 for i in range(0, len(current_map.start_positions)):
     # Get the starting position of the tank "i"
     pos = current_map.start_positions[i]
+    orientation = pos[2]
+    if args.seed is not None:
+        orientation += rng.uniform(-START_JITTER, START_JITTER)
     # Create the tank, images.tanks contains the image representing the tank
-    tank = gameobjects.Tank(pos[0], pos[1], pos[2], images.tanks[i], space)
-    if i == 0:
+    # The colors are used again when there are more tanks than colors
+    color = i % len(images.tanks)
+    tank = gameobjects.Tank(pos[0], pos[1], orientation, images.tanks[color],
+                            space, bullet_pool)
+    if i == 0 and not all_ai:
         player_tank = tank
-    elif i == 1 and player_mode == "hot multiplayer":
+    elif i == 1 and player_mode == "hot multiplayer" and not all_ai:
         scnd_player_tank = tank
     else:
-        ai_tank = ai.Ai(tank, game_objects_list, tanks_list, space,
-                        current_map)
+        ai_tank = ai.Ai(tank, game_objects, tanks_list, space,
+                        current_map, flow_fields,
+                        line_of_sight=line_of_sight,
+                        path_planner=path_planner)
         ai_list.append(ai_tank)
     base = gameobjects.GameVisibleObject(current_map.start_positions[i][0],
                                          current_map.start_positions[i][1],
-                                         images.bases[i])
-    game_objects_list.append(base)
+                                         images.bases[color])
+    game_objects.add(base)
     # Add the tank to the list of objects to display
-    game_objects_list.append(tank)
+    game_objects.add(tank)
     # Add the tank to the list of tanks
     tanks_list.append(tank)
 
@@ -141,15 +307,62 @@ for i in tanks_list:
 flag = gameobjects.Flag(current_map.flag_position[0],
                         current_map.flag_position[1])
 # Add the flag to the list of objects to display
-game_objects_list.append(flag)
+game_objects.add(flag)
 respawn_cooldown = 0
 
+# -- Tells which ai decide on each tick, see --ai-budget
+ai_scheduler = scheduler.AiScheduler(ai_list, tanks_list, flag, args.ai_budget)
+
+# The tanks of the players, in the order of their number in the replays
+player_tanks = [tank for tank in (player_tank, scnd_player_tank) if tank]
+
+# -- Draws the game objects on the screen, the camera follows the players,
+# or the first tank when the ai plays alone
+game_renderer = None
+if not headless:
+    camera = renderer.Camera(screen.get_size(), current_map.rect().size,
+                             player_tanks or tanks_list[:1])
+    game_renderer = renderer.Renderer(screen, create_background(),
+                                      args.full_redraw, camera, space)
+
+# -- Saves and restores the state of the match
+snapshotter = snapshot.Snapshotter(space, game_objects, tanks_list, ai_list,
+                                   movable_box_list, flag, game_score,
+                                   current_map, bullet_pool)
+
+# -- Measures how long each phase of the frames takes
+# The frames are only timed when they are written to a file or shown
+if args.timings is not None:
+    frame_timer = timing.FrameTimer(args.timings)
+else:
+    frame_timer = timing.NullTimer()
+show_timings = False
+
+# -- Records the match
+recorder = None
+if args.record is not None:
+    recorder = replay.Recorder(args.record, replay.Header(
+        args.map, args.seed, TICK_RATE, player_mode, all_ai,
+        replay.KEYFRAME_INTERVAL))
+
+
+def remove_bullet(bullet):
+    """
+        A function that takes a bullet out of the game after it hit something
+        and gives it back to the pool. Returns False if the bullet had already
+        hit something else during this step.
+    """
+    if bullet not in game_objects:
+        return False
+    game_objects.remove(bullet)
+    bullet_pool.release(bullet)
+    return True
+
 
 def collision_bullet_tank(arb, space, data):
     """A function that handels collisions between a bullet and a tank."""
-    if(arb.shapes[0].parent in game_objects_list):
-        game_objects_list.remove(arb.shapes[0].parent)
-    space.remove(arb.shapes[0], arb.shapes[0].body)
+    if not remove_bullet(arb.shapes[0].parent):
+        return False
     tank = arb.shapes[1]
     if tank.parent.respawn_cooldown == 0:
         damaged_tank(tank)
@@ -167,26 +380,27 @@ def damaged_tank(tank):
         tank.parent.hp = 2
         tank.parent.body.position = tank.parent.start_position
         tank.parent.respawn_cooldown = 300
+        for ai_player in ai_list:
+            if ai_player.tank is tank.parent:
+                ai_player.respawned()
         explosion = gameobjects.Explosion(tank.parent.body.position[0],
                                           tank.parent.body.position[1],
                                           tank.parent.body.angle,
                                           images.explosion, space)
-        game_objects_list.append(explosion)
+        game_objects.add(explosion)
         explosion.exp_cooldown = 2
 
 
 def collision_bullet(arb, space, data):
     """A function that handels collisions between a bullet and other things."""
-    game_objects_list.remove(arb.shapes[0].parent)
-    space.remove(arb.shapes[0], arb.shapes[0].body)
+    remove_bullet(arb.shapes[0].parent)
     return False
 
 
 def collision_bullet_woodbox(arb, space, data):
     """A function that handels collisions between a bullet and a woodbox."""
-    if arb.shapes[0].parent in game_objects_list:
-        game_objects_list.remove(arb.shapes[0].parent)
-    space.remove(arb.shapes[0], arb.shapes[0].body)
+    if not remove_bullet(arb.shapes[0].parent):
+        return False
     box = arb.shapes[1]
     damaged_woodbox(box)
     return False
@@ -198,28 +412,71 @@ def damaged_woodbox(box):
         box.parent.hp -= 1
     else:
         box.parent.hp = 2
-        box_list.remove(box.parent)
-        game_objects_list.remove(box.parent)
+        game_objects.remove(box.parent)
         space.remove(box, box.body)
+        # Another box may have been pushed onto the same tile
+        tile = box.parent.tile
+        current_map.set_box(tile[0], tile[1],
+                            box_types_by_tile().get(tile, 0))
+        boxes_changed()
         explosion = gameobjects.Explosion(box.parent.body.position[0],
                                           box.parent.body.position[1],
                                           box.parent.body.angle,
                                           images.explosion, space)
-        game_objects_list.append(explosion)
+        game_objects.add(explosion)
         explosion.exp_cooldown = 2
         sound.wood_destruction.set_volume(0.2)
         sound.wood_destruction.play()
         return explosion
 
 
+def boxes_changed():
+    """
+        A function that tells the ai that boxes have been destroyed or moved,
+        so that they search new paths. The version of the map tells the flow
+        fields and the costs of the ai that they are outdated.
+    """
+    for ai_player in ai_list:
+        ai_player.boxes_changed()
+
+
+def update_box_tiles():
+    """
+        A function that updates the map with the boxes that have been pushed
+        to another tile.
+    """
+    changed = set()
+    for box in game_objects.of_type(gameobjects.Box):
+        previous = box.moved_tile()
+        if previous is not None:
+            changed.add(previous)
+            changed.add(box.tile)
+    if not changed:
+        return
+    # Boxes can move onto a tile another box leaves in the same tick, or has
+    # not left yet, so the tiles are written once every box is on its new
+    # tile, from the boxes that are on them
+    boxes = box_types_by_tile()
+    for tile in changed:
+        current_map.set_box(tile[0], tile[1], boxes.get(tile, 0))
+    boxes_changed()
+
+
+def box_types_by_tile():
+    """
+        A function that returns the type of the box on every tile with a box
+        that can be moved or destroyed.
+    """
+    return {box.tile: box.boxmodel.box_type
+            for box in game_objects.of_type(gameobjects.Box)}
+
+
 def collision_bullet_box(arb, space, data):
     """
        A function that handels collision between boxes that are
        not a wooden box and a bullet.
     """
-    if(arb.shapes[0].parent in game_objects_list):
-        game_objects_list.remove(arb.shapes[0].parent)
-    space.remove(arb.shapes[0], arb.shapes[0].body)
+    remove_bullet(arb.shapes[0].parent)
     return True
 
 handler = space.add_collision_handler(1, 0)
@@ -235,9 +492,12 @@ handler = space.add_collision_handler(1, 4)
 handler.pre_solve = collision_bullet_box
 
 
-def score(flag, game_score, player_tank, game_objects_list, tanks_list,
+def score(flag, game_score, player_tank, game_objects, tanks_list,
           current_map, index):
     """A function that displays the score on the console."""
+    global first_capture_tick, score_screen
+    if first_capture_tick is None:
+        first_capture_tick = ticks
     game_score[index] += 1
     player_tank.flag = None
     sound.victory.set_volume(0.2)
@@ -249,175 +509,335 @@ def score(flag, game_score, player_tank, game_objects_list, tanks_list,
         score_str.append("Player " + str(i + 1) + ": " + str(game_score[i]))
         print("Player ", str(i + 1), ": ", game_score[i])
     print(" ")
-    display_score(score_str, player_tank)
+    if not headless and not fast_forward:
+        # Shown by the main loop from the next frame
+        score_screen = scorescreen.ScoreScreen(score_str, args.score_timeout)
     for tank in tanks_list:
         tank.body.position = tank.start_position
-    for elm in box_list:
-        game_objects_list.remove(elm)
-    create_boxes()
-
-
-def display_score(score_str, tank):
-    """A function that displays the score on the pygame window."""
-    score_str.append("Press h to continue...")
-    pygame.display.set_caption('Score of the Players')
-    font = pygame.font.Font('freesansbold.ttf', 16)
-    blue = (0, 0, 128)
-    white = (255, 255, 255)
+    for ai_player in ai_list:
+        ai_player.respawned()
+    reset_boxes()
+
+
+def show_score():
+    """
+        Runs one frame of the score screen: reads the events, draws the
+        screen and waits for the next frame. Returns False when the game
+        should be closed.
+    """
+    global score_screen
     running = True
-    while running:
-        screen.fill(white)
-        for i in range(len(score_str)):
-            text = font.render(score_str[i], True, blue)
-            textRect = text.get_rect()
-            textRect.center = (150, (60 + i * 20))
-            screen.blit(text, textRect)
-        pygame.display.update()
-        for event in pygame.event.get():
-            if event.type == KEYDOWN and event.key == K_h:
-                running = False
-    pygame.display.set_caption('pygame window')
-    pygame.display.update()
+    done = False
+    for event in pygame.event.get():
+        if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+            running = False
+        done = score_screen.handle_event(event) or done
+    score_screen.draw(screen)
+    pygame.display.flip()
+    done = score_screen.update(clock.tick(FRAMERATE) / 1000) or done
+    if done:
+        score_screen.close()
+        score_screen = None
+        # The score covered the game, so the next frame has to redraw
+        # everything
+        game_renderer.invalidate()
+    # The time spent looking at the score is not part of the frames
+    frame_timer.skip()
+    return running
 
 
 # ----- Main Loop -----#
+
+# -- Actions of the players, they are applied between two ticks
+ACCELERATE, DECELERATE, TURN_LEFT, TURN_RIGHT, STOP_MOVING, STOP_TURNING, \
+    SHOOT = range(7)
+
+# For each player, the actions of a key when it is pressed and released
+PLAYER_KEYS = [{K_UP: (ACCELERATE, STOP_MOVING),
+                K_DOWN: (DECELERATE, STOP_MOVING),
+                K_LEFT: (TURN_LEFT, STOP_TURNING),
+                K_RIGHT: (TURN_RIGHT, STOP_TURNING),
+                K_SPACE: (SHOOT, None)},
+               {K_w: (ACCELERATE, STOP_MOVING),
+                K_s: (DECELERATE, STOP_MOVING),
+                K_a: (TURN_LEFT, STOP_TURNING),
+                K_d: (TURN_RIGHT, STOP_TURNING),
+                K_x: (SHOOT, None)}]
+
+
+def player_action(player, action):
+    """ Applies an action to the tank of a player and records it. """
+    if recorder is not None:
+        recorder.action(ticks, player, action)
+    tank = player_tanks[player]
+    if action == ACCELERATE:
+        tank.accelerate()
+    elif action == DECELERATE:
+        tank.decelerate()
+    elif action == TURN_LEFT:
+        tank.turn_left()
+    elif action == TURN_RIGHT:
+        tank.turn_right()
+    elif action == STOP_MOVING:
+        tank.stop_moving()
+    elif action == STOP_TURNING:
+        tank.stop_turning()
+    elif action == SHOOT:
+        bullet = tank.shoot(space)
+        if bullet is not None:
+            game_objects.add(bullet)
+
+
+def handle_events():
+    """
+        Reads the keyboard and window events and applies them to the
+        player tanks. Returns False when the game should be closed.
+    """
+    running = True
+    for event in pygame.event.get():
+        # Check if we receive a QUIT event (for instance, if the user press
+        # the close button of the window) or if the user press the escape
+        # key.
+        if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+            running = False
+        if event.type == KEYDOWN and event.key == K_F3:
+            toggle_timings()
+        # The players of a replay only do what was recorded
+        if replay_file is not None or event.type not in (KEYDOWN, KEYUP):
+            continue
+        for player in range(len(player_tanks)):
+            actions = PLAYER_KEYS[player].get(event.key)
+            if actions is not None:
+                action = actions[0] if event.type == KEYDOWN else actions[1]
+                if action is not None:
+                    player_action(player, action)
+    return running
+
+
+def toggle_timings():
+    """ Shows or hides the timing of the frames over the game. """
+    global show_timings, frame_timer
+    show_timings = not show_timings
+    if args.timings is None:
+        frame_timer = timing.FrameTimer() if show_timings \
+            else timing.NullTimer()
+        frame_timer.start()
+    if not show_timings:
+        # The background behind the timings has to be drawn again
+        game_renderer.invalidate()
+
+
+def reset_flag():
+    """ Puts the flag back on its starting position. """
+    flag.is_on_tank = False
+    flag.x = current_map.flag_position[0]
+    flag.y = current_map.flag_position[1]
+    flag.orientation = 0
+
+
+# Counts down the ticks until the objects are updated again
+skip_update = 0
+# Number of ticks run since the start of the match
+ticks = 0
+# The tick at which the first flag was captured
+first_capture_tick = None
+# Set while a replay is run to the tick it starts at, nothing is shown then
+fast_forward = False
+# The score screen while it is shown, the game is paused meanwhile
+score_screen = None
+
+
+def capture_state():
+    """ Returns the state of the match as bytes, see snapshot.py. """
+    return snapshotter.capture(ticks, skip_update, first_capture_tick)
+
+
+def restore_state(state):
+    """ Puts the match back in a state returned by capture_state. """
+    global ticks, skip_update, first_capture_tick
+    ticks, skip_update, first_capture_tick = snapshotter.restore(state)
+    if game_renderer is not None:
+        game_renderer.invalidate()
+
+
+def game_tick():
+    """
+        A function that runs one tick of the game: the flags, the physics
+        and the ai.
+    """
+    global skip_update, ticks
+
+    ticks += 1
+    for i in range(len(ai_list)):
+        ai_list[i].tank.try_grab_flag(flag)
+        if ai_list[i].tank.has_won():
+            ai_list[i].tank.flag = None
+            ai_list[i].flag = None
+            reset_flag()
+            score(flag, game_score, ai_list[i].tank, game_objects,
+                  tanks_list, current_map,
+                  tanks_list.index(ai_list[i].tank))
+
+    if player_tank is not None:
+        player_tank.try_grab_flag(flag)
+    if player_mode == "hot multiplayer" and scnd_player_tank:
+        scnd_player_tank.try_grab_flag(flag)
+    frame_timer.lap("flag_checks")
+    # -- Update physicsupdate
+    if skip_update == 0:
+        # Loop over the game objects that move by themselves and update
+        # their speed in function of their acceleration.
+        game_objects.update()
+        skip_update = 2
+    else:
+        skip_update -= 1
+    frame_timer.lap("update")
+
+    for explosion in game_objects.of_type(gameobjects.Explosion):
+        if explosion.exp_cooldown == 0:
+            game_objects.remove(explosion)
+    frame_timer.lap("explosions")
+
+    #   Check collisions and update the objects position
+    space.step(1 / TICK_RATE)
+    update_box_tiles()
+    frame_timer.lap("step")
+
+    #  Update object that depends on an other object position
+    # (for instance a flag)
+    game_objects.post_update()
+    frame_timer.lap("post_update")
+
+    line_of_sight.new_tick()
+    ai_scheduler.decide()
+    frame_timer.lap("decide")
+
+    if player_tank is not None and player_tank.has_won():
+        player_tank.flag = None
+        reset_flag()
+        score(flag, game_score, player_tank, game_objects,
+              tanks_list, current_map, 0)
+    elif player_mode == "hot multiplayer" and scnd_player_tank and \
+            scnd_player_tank.has_won():
+        scnd_player_tank.flag = None
+        reset_flag()
+        score(flag, game_score, scnd_player_tank, game_objects,
+              tanks_list, current_map, 1)
+    frame_timer.lap("flag_checks")
+
+
+def replay_actions():
+    """ Applies the actions recorded before the next tick of a replay. """
+    for player, action in replay_file.actions.get(ticks, ()):
+        player_action(player, action)
+
+
+def seek(tick):
+    """
+        Moves a replay to tick: the match is put in the state of the last
+        keyframe before it, then simulated up to it. Returns False if the
+        match did not start from its recorded state, it can then drift away
+        from the recording (the physics engine keeps things that are not in
+        the keyframes, like the contacts of the last step).
+    """
+    global fast_forward
+    keyframe_tick, state = replay_file.keyframe_before(tick)
+    restored = keyframe_tick > ticks
+    if restored:
+        restore_state(state)
+    fast_forward = True
+    while ticks < tick:
+        replay_actions()
+        game_tick()
+    fast_forward = False
+    return not restored
+
+
 def play():
-    """A function that runs the game."""
+    """
+        A function that runs the game. The game runs TICK_RATE ticks per
+        second whatever the framerate is: when drawing is slow, several ticks
+        are run before the next frame (at most MAX_CATCH_UP), and when it is
+        fast, the frames show the objects between two ticks. In headless mode
+        nothing is drawn and the ticks are run as fast as possible, the game
+        then stops after args.ticks ticks or args.rounds captured flags.
+    """
     # -- Control whether the game run
     running = True
-    skip_update = 0
-    index = []
+    # Whether a replay can still be compared to its keyframes
+    verify = False
+    if replay_file is not None:
+        verify = seek(min(args.seek, replay_file.end_tick))
+    if recorder is not None:
+        recorder.keyframe(ticks, capture_state())
+    tick_time = 1 / TICK_RATE
+    # Time that has passed but has not been simulated yet
+    lag = 0.0
+    clock.tick()
+    frame_timer.start()
     while running:
-        # -- Handle the events
-        for event in pygame.event.get():
-            # Check if we receive a QUIT event (for instance, if the user press
-            # the close button of the window) or if the user press the escape
-            # key.
-            if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
-                running = False
-            if event.type == KEYDOWN and event.key == K_UP:
-                player_tank.accelerate()
-            if event.type == KEYUP and event.key == K_UP:
-                player_tank.stop_moving()
-            if event.type == KEYDOWN and event.key == K_DOWN:
-                player_tank.decelerate()
-            if event.type == KEYUP and event.key == K_DOWN:
-                player_tank.stop_moving()
-            if event.type == KEYDOWN and event.key == K_LEFT:
-                player_tank.turn_left()
-            if event.type == KEYUP and event.key == K_LEFT:
-                player_tank.stop_turning()
-            if event.type == KEYDOWN and event.key == K_RIGHT:
-                player_tank.turn_right()
-            if event.type == KEYUP and event.key == K_RIGHT:
-                player_tank.stop_turning()
-            if event.type == KEYDOWN and event.key == K_SPACE:
-                bullet = player_tank.shoot(space)
-                if bullet is not None:
-                    game_objects_list.append(bullet)
-
-            if player_mode == "hot multiplayer":
-                if event.type == KEYDOWN and event.key == K_w:
-                    scnd_player_tank.accelerate()
-                if event.type == KEYUP and event.key == K_w:
-                    scnd_player_tank.stop_moving()
-                if event.type == KEYDOWN and event.key == K_s:
-                    scnd_player_tank.decelerate()
-                if event.type == KEYUP and event.key == K_s:
-                    scnd_player_tank.stop_moving()
-                if event.type == KEYDOWN and event.key == K_a:
-                    scnd_player_tank.turn_left()
-                if event.type == KEYUP and event.key == K_a:
-                    scnd_player_tank.stop_turning()
-                if event.type == KEYDOWN and event.key == K_d:
-                    scnd_player_tank.turn_right()
-                if event.type == KEYUP and event.key == K_d:
-                    scnd_player_tank.stop_turning()
-                if event.type == KEYDOWN and event.key == K_x:
-                    bullet = scnd_player_tank.shoot(space)
-                    if bullet != None:
-                        game_objects_list.append(bullet)
-
-        for i in range(len(ai_list)):
-            ai_list[i].tank.try_grab_flag(flag)
-            if ai_list[i].tank.has_won():
-                ai_list[i].tank.flag = None
-                ai_list[i].flag = None
-                flag.is_on_tank = False
-                flag.x = current_map.flag_position[0]
-                flag.y = current_map.flag_position[1]
-                flag.orientation = 0
-                if player_mode == "hot multiplayer":
-                    score(flag, game_score, ai_tank, game_objects_list,
-                          tanks_list, current_map, 2 + i)
-                else:
-                    score(flag, game_score, ai_tank, game_objects_list,
-                          tanks_list, current_map, 1 + i)
-
-        player_tank.try_grab_flag(flag)
-        if player_mode == "hot multiplayer":
-            scnd_player_tank.try_grab_flag(flag)
-        # -- Update physicsupdate
-        if skip_update == 0:
-            # Loop over all the game objects and update their speed in function
-            # of their acceleration.
-            for i in range(len(game_objects_list)):
-                game_objects_list[i].update()
-            skip_update = 2
+        if score_screen is not None:
+            running = show_score()
+            continue
+        if headless:
+            tick_count = 1
         else:
-            skip_update -= 1
-
-        for i in range(len(game_objects_list)):
-            if isinstance(game_objects_list[i], gameobjects.Explosion):
-                if game_objects_list[i].exp_cooldown == 0:
-                    index.append(game_objects_list[i])
-
-        for elm in index:
-            if elm is not None:
-                game_objects_list.remove(elm)
-        index.clear()
-
-        #   Check collisions and update the objects position
-        space.step(1 / FRAMERATE)
-
-        #  Update object that depends on an other object position
-        # (for instance a flag)
-        for obj in game_objects_list:
-            obj.post_update()
-
-        for tank in ai_list:
-            tank.decide()
-
-        # -- Update Display
-        # Display the background on the screen
-        screen.blit(background, (0, 0))
-
-        # Update the display of the game objects on the screen
-        for obj in game_objects_list:
-            obj.update_screen(screen)
-
-        #   Redisplay the entire screen (see double buffer technique)
-        pygame.display.flip()
-
-        #  Control the game framerate
-        clock.tick(FRAMERATE)
-
-        if player_tank.has_won():
-            tank.flag = None
-            flag.is_on_tank = False
-            flag.x = current_map.flag_position[0]
-            flag.y = current_map.flag_position[1]
-            flag.orientation = 0
-            score(flag, game_score, player_tank, game_objects_list,
-                  tanks_list, current_map, 0)
-        elif player_mode == "hot multiplayer" and scnd_player_tank.has_won():
-            tank.flag = None
-            flag.is_on_tank = False
-            flag.x = current_map.flag_position[0]
-            flag.y = current_map.flag_position[1]
-            flag.orientation = 0
-            score(flag, game_score, scnd_player_tank, game_objects_list,
-                  tanks_list, current_map, 1)
+            # -- Handle the events
+            running = handle_events()
+            frame_timer.lap("events")
+            lag += clock.tick(FRAMERATE) / 1000
+            frame_timer.lap("tick")
+            tick_count = min(int(lag / tick_time), MAX_CATCH_UP)
+            lag -= tick_count * tick_time
+            # If the game could not catch up, the rest is skipped, the game
+            # then runs slower instead of drawing less and less often
+            lag = min(lag, tick_time)
+
+        for i in range(tick_count):
+            if not headless:
+                game_renderer.save_states(game_objects)
+                frame_timer.lap("render")
+            if replay_file is not None:
+                replay_actions()
+            frame_timer.lap("replay")
+            game_tick()
+            if recorder is not None and \
+               ticks % recorder.header.keyframe_interval == 0:
+                recorder.keyframe(ticks, capture_state())
+            if verify and ticks in replay_file.keyframes and \
+               replay_file.keyframe(ticks) != capture_state():
+                print("The replay differs from the recording from tick",
+                      ticks, file=sys.stderr)
+                verify = False
+            frame_timer.lap("replay")
+            if args.ticks is not None and ticks >= args.ticks:
+                running = False
+            if replay_file is not None and ticks >= replay_file.end_tick:
+                running = False
+            if args.rounds is not None and sum(game_score) >= args.rounds:
+                running = False
+            if not running or score_screen is not None:
+                break
+
+        if not headless and score_screen is None:
+            # -- Update Display
+            # Redraw the parts of the screen where the game objects changed,
+            # lag / tick_time tells how far the next tick is
+            game_renderer.draw(game_objects, lag / tick_time)
+            if show_timings:
+                game_renderer.mark_dirty(frame_timer.draw(screen))
+            frame_timer.lap("render")
+            game_renderer.present()
+            frame_timer.lap("flip")
+        frame_timer.end_frame(ticks)
+
+    if recorder is not None:
+        recorder.close(ticks)
+    if path_planner is not None:
+        path_planner.close()
+    frame_timer.close()
+    if headless:
+        print("Simulated", ticks, "ticks, final score:", game_score)
 
 
 play()
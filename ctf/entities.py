@@ -0,0 +1,134 @@
+"""
+    The file contains the registry of the game objects, which replaces a
+    plain list so that objects can be added and removed in constant time and
+    a tick only visits the objects that need it.
+"""
+
+import weakref
+
+import gameobjects
+
+
+def overrides(obj, method):
+    """ Checks if the class of obj overrides a method of GameObject. """
+    return getattr(type(obj), method) is not getattr(gameobjects.GameObject,
+                                                     method)
+
+
+class EntityRegistry:
+    """
+        Holds all the game objects in the order they were added, which is
+        also the order they are drawn in. The objects are grouped by type,
+        and the ones whose update or post_update actually do something are
+        kept apart so that a tick does not go through every box of the map.
+        Dictionaries are used as ordered sets, which gives constant time
+        insertion, removal and membership tests.
+    """
+
+    def __init__(self):
+        # For each object, the number of objects added before it
+        self.objects        = {}
+        self.added          = 0
+        self.by_type        = {}
+        self.updatable      = {}
+        self.post_updatable = {}
+        # The place of the removed objects, for restore
+        self.removed        = weakref.WeakKeyDictionary()
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __contains__(self, obj):
+        return obj in self.objects
+
+    def add(self, obj):
+        """ Adds a game object, adding it twice has no effect. """
+        if obj in self.objects:
+            return
+        self.insert(obj, self.added)
+        self.added += 1
+
+    def restore(self, objects):
+        """
+            Adds back objects that were removed, each one at the place it
+            had among the objects (and so in the drawing order), as if it
+            had never been removed. The other objects are added last.
+        """
+        restored = False
+        for obj in objects:
+            if obj in self.objects:
+                continue
+            index = self.removed.get(obj)
+            if index is None:
+                self.add(obj)
+            else:
+                self.insert(obj, index)
+                restored = True
+        if restored:
+            self.sort()
+
+    def insert(self, obj, index):
+        """ Adds a game object that is not there with the given place. """
+        self.removed.pop(obj, None)
+        self.objects[obj] = index
+        self.by_type.setdefault(type(obj), {})[obj] = None
+        if overrides(obj, "update"):
+            self.updatable[obj] = None
+        if overrides(obj, "post_update"):
+            self.post_updatable[obj] = None
+
+    def remove(self, obj):
+        """ Removes a game object, raises a ValueError if it is not there. """
+        if obj not in self.objects:
+            raise ValueError("the game object is not in the registry")
+        self.discard(obj)
+
+    def discard(self, obj):
+        """ Removes a game object if it is there. """
+        if obj not in self.objects:
+            return
+        self.removed[obj] = self.objects.pop(obj)
+        del self.by_type[type(obj)][obj]
+        self.updatable.pop(obj, None)
+        self.post_updatable.pop(obj, None)
+
+    def sort(self):
+        """
+            Sorts the dictionaries in the order the objects were added, after
+            objects were put back at their place by restore.
+        """
+        self.objects = dict(sorted(self.objects.items(),
+                                   key=lambda item: item[1]))
+        for obj_type, objects in self.by_type.items():
+            self.by_type[obj_type] = dict.fromkeys(self.in_order(objects))
+        self.updatable = dict.fromkeys(self.in_order(self.updatable))
+        self.post_updatable = dict.fromkeys(
+            self.in_order(self.post_updatable))
+
+    def of_type(self, cls):
+        """ Returns the objects that are instances of cls, as a list. """
+        found = []
+        for obj_type, objects in self.by_type.items():
+            if issubclass(obj_type, cls):
+                found.extend(objects)
+        return found
+
+    def in_order(self, objects):
+        """
+            Returns objects of the registry sorted in the order they were
+            added, which is the order they are drawn in.
+        """
+        return sorted(objects, key=self.objects.__getitem__)
+
+    def update(self):
+        """ Calls update on the objects that implement it. """
+        for obj in list(self.updatable):
+            obj.update()
+
+    def post_update(self):
+        """ Calls post_update on the objects that implement it. """
+        for obj in list(self.post_updatable):
+            obj.post_update()
@@ -0,0 +1,173 @@
+"""
+    The file contains the flow fields shared by all the ai. A flow field is
+    computed with one search from a target tile, and tells for every tile of
+    the map which neighbor is the next step towards the target. The search
+    (see planner.py) can be done at once, a bit at a time over several ticks
+    or by the workers of a path planner.
+"""
+
+from collections import OrderedDict, deque
+from pymunk import Vec2d
+from maps import IMPASSABLE
+import planner
+
+MAX_FIELDS = 16   # Maximum number of flow fields kept in the cache
+
+
+class FlowFields:
+    """
+        Computes and caches the flow fields of a map. Every ai going to the
+        same target reads the same field, so the search is only done once
+        per target instead of once per ai and move. The fields only have to
+        be computed again when the target moves or when the boxes of the
+        map change, which is noticed with the version of the map.
+    """
+
+    def __init__(self, currentmap, tile_costs, path_planner=None):
+        """
+            tile_costs gives the cost of entering a tile for each box type,
+            it should be the same as the one used by the ai (ai.TILE_COSTS).
+            path_planner is an optional planner.PathPlanner whose workers
+            compute the fields.
+        """
+        self.currentmap     = currentmap
+        self.tile_costs     = tile_costs
+        self.path_planner   = path_planner
+        self.costs          = currentmap.cost_grid(tile_costs)
+        self.map_version    = currentmap.version
+        # The fields, ordered from least to most recently used
+        self.fields         = OrderedDict()
+        # The searches of the fields not computed yet (generators, or the
+        # results of the workers to come) and the version of the map they
+        # read, by target
+        self.pending        = {}
+
+    def invalidate(self):
+        """ Forgets every field and computes the costs of the tiles again. """
+        self.costs = self.currentmap.cost_grid(self.tile_costs)
+        self.map_version = self.currentmap.version
+        self.fields.clear()
+        # The searches done in the game read the old costs and are dropped.
+        # The workers search on a copy of them, the fields they find still
+        # serve the ai waiting for them (see advance).
+        if self.path_planner is None:
+            self.pending.clear()
+
+    def field(self, target):
+        """
+            Returns the flow field towards the target tile index as two
+            dictionaries: the next tile on the cheapest path to the target
+            and the cost of that path, for every tile that can reach it.
+        """
+        return planner.finish(self.search(target, wait=True))
+
+    def search(self, target, wait=False):
+        """
+            A generator that computes the flow field towards the target tile
+            index and returns it. It pauses (yields) every
+            planner.SEARCH_STEP tiles so that the search can be spread over
+            several ticks, or with a path planner, until the workers are
+            done (wait makes it wait for them instead). The search is kept
+            between the pauses and shared by every ai waiting for the same
+            field.
+        """
+        while True:
+            if self.map_version != self.currentmap.version:
+                self.invalidate()
+            field = self.fields.get(target)
+            if field is not None:
+                self.fields.move_to_end(target)
+                return field
+            field = self.advance(target, wait)
+            if field is not None:
+                return field
+            yield
+
+    def advance(self, target, wait=False):
+        """
+            Goes on with the search of the field towards target, returns the
+            field once it is computed and None until then. Without a path
+            planner, the search goes on for planner.SEARCH_STEP tiles,
+            otherwise it tells if the workers are done (wait makes it wait
+            for them). A field the workers computed from the costs before a
+            change of the map is returned to the ai that waited for it, but
+            it is not kept and it is not waited for.
+        """
+        version, search = self.pending.get(target, (None, None))
+        if wait and version != self.map_version:
+            search = None
+        if search is None:
+            arguments = (self.costs, self.currentmap.width,
+                         self.currentmap.height, target)
+            if self.path_planner is not None:
+                search = self.path_planner.submit(planner.flow_field,
+                                                  *arguments)
+            else:
+                search = planner.flow_field(*arguments)
+            version = self.map_version
+            self.pending[target] = (version, search)
+        if self.path_planner is not None:
+            if not wait and not search.ready():
+                return None
+            field = search.get()
+        else:
+            try:
+                next(search)
+                return None
+            except StopIteration as over:
+                field = over.value
+
+        del self.pending[target]
+        if version == self.map_version:
+            self.fields[target] = field
+            if len(self.fields) > MAX_FIELDS:
+                self.fields.popitem(last=False)
+        return field
+
+    def next_step(self, tile, target, field=None):
+        """
+            Returns the index of the next tile to go to from tile in order to
+            reach the target, or None if the target can not be reached.
+            field is the flow field to read, by default the one of target.
+        """
+        if field is None:
+            field = self.field(target)
+        next_tile, cost_to_target = field
+        if tile in next_tile:
+            return next_tile[tile]
+        # The tank can stand on a tile that is not passable itself (for
+        # instance a tile where a metal box was), then it leaves by the
+        # neighbor with the cheapest path to the target.
+        best = None
+        best_cost = None
+        for neighbor in self.currentmap.neighbors(tile):
+            if neighbor in next_tile and self.costs[neighbor] != IMPASSABLE:
+                cost = cost_to_target[neighbor] + self.costs[neighbor]
+                if best is None or cost < best_cost:
+                    best = neighbor
+                    best_cost = cost
+        return best
+
+    def path(self, tile, target, field=None):
+        """
+            Returns the path from tile to target, both given as (x, y), in the
+            same form as Ai.find_shortest_path: a deque of tiles where the next
+            step is the last element. The deque is empty if the target can not
+            be reached or if tile is the target. field is the flow field to
+            read, by default the one of target.
+        """
+        width = self.currentmap.width
+        tile = tile[1] * width + tile[0]
+        target = target[1] * width + target[0]
+        if tile == target:
+            return deque()
+        if field is None:
+            field = self.field(target)
+        step = self.next_step(tile, target, field)
+        next_tile = field[0]
+        path = []
+        while step is not None:
+            path.append(Vec2d(step % width, step // width))
+            step = next_tile[step]
+        path.reverse()
+        return deque(path)
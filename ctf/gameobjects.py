@@ -48,18 +48,20 @@ class GameObject:
         """
         return
 
-    def update_screen(self, screen):
+    def screen_sprite(self, position=None, orientation=None):
         """
-            Updates the visual part of the game. Should NOT need to be changed
-            by a subclass.
+            Returns the sprite rotated like the object and the rectangle that
+            it covers on the screen. The position and orientation on the
+            screen can be given, for instance to draw the object between two
+            ticks, otherwise the current ones are used.
         """
-        sprite = self.sprite
-
-        p = self.screen_position()
-        # Get the position of the object (pygame coordinates)
-
-        sprite = pygame.transform.rotate(sprite, self.screen_orientation())
-        # Rotate the sprite using the rotation of the object
+        if position is None:
+            position = self.screen_position()
+        if orientation is None:
+            orientation = self.screen_orientation()
+        sprite = images.rotate(self.sprite, orientation)
+        # Rotate the sprite using the rotation of the object, the rotations
+        # are cached since most objects keep the same angle between frames
 
         # The position of the screen correspond to the center of the object,
         # but the function screen.blit expect to receive the top left corner
@@ -67,8 +69,17 @@ class GameObject:
         # which is the vector between the center of the sprite and the top left
         # corner of the sprite
         offset = pymunk.Vec2d(sprite.get_size()) / 2.
-        p = p - offset
-        screen.blit(sprite, p)   # Copy the sprite on the screen
+        p = position - offset
+        return sprite, pygame.Rect(int(p[0]), int(p[1]), sprite.get_width(),
+                                   sprite.get_height())
+
+    def update_screen(self, screen, position=None, orientation=None):
+        """
+            Updates the visual part of the game. Should NOT need to be changed
+            by a subclass.
+        """
+        sprite, rect = self.screen_sprite(position, orientation)
+        screen.blit(sprite, rect)   # Copy the sprite on the screen
 
 
 class GamePhysicsObject(GameObject):
@@ -140,8 +151,8 @@ class GamePhysicsObject(GameObject):
         """ Angles are reversed from the engine to the display. """
         return -math.degrees(self.body.angle)
 
-    def update_screen(self, screen):
-        super().update_screen(screen)
+    def update_screen(self, screen, position=None, orientation=None):
+        super().update_screen(screen, position, orientation)
         # debug draw
         if DEBUG:
             ps = [self.body.position+p for p in self.points]
@@ -170,13 +181,40 @@ class Bullet(GamePhysicsObject):
     def __init__(self, x, y, orientation, sprite, space):
         super().__init__(x, y, orientation, sprite, space, True)
         self.shape.collision_type = 1
+        self.arm(orientation)
+
+    ACCELERATION = 0.0
+    MAX_SPEED = 8.0
+
+    def arm(self, orientation):
+        """ Gives the bullet its speed in the direction of the shot. """
         self.bullet_velocity      = 3.0
         self.bullet_acceleration  = 0.0
         self.body.velocity = pymunk.Vec2d(self.bullet_velocity, 0)
+        self.body.angular_velocity = 0
         self.shooting_angle = orientation
 
-    ACCELERATION = 0.0
-    MAX_SPEED = 8.0
+    def rearm(self, x, y, orientation, sprite):
+        """
+            Reuses a bullet that is out of the game for a new shot, with the
+            same arguments as the constructor (except the space).
+        """
+        if sprite.get_size() != self.sprite.get_size():
+            # The shape has the size of the sprite, which depends on the
+            # rotation of the sprite
+            half_width = 0.5 * sprite.get_width() / images.TILE_SIZE
+            half_height = 0.5 * sprite.get_height() / images.TILE_SIZE
+            self.half_width = half_width
+            self.half_height = half_height
+            self.points = [[-half_width, -half_height],
+                           [-half_width, half_height],
+                           [half_width, half_height],
+                           [half_width, -half_height]]
+            self.shape.unsafe_set_vertices(self.points)
+        self.sprite = sprite
+        self.body.position = x, y
+        self.body.angle = math.radians(orientation)
+        self.arm(orientation)
 
     def update(self):
         """
@@ -191,6 +229,41 @@ class Bullet(GamePhysicsObject):
         self.body.position += 0.01 * self.body.velocity
 
 
+class BulletPool:
+    """
+        Keeps the bullets that have hit something, so that new shots reuse
+        their bodies and shapes instead of creating new ones.
+    """
+
+    MAX_SIZE = 32   # Maximum number of bullets kept for later
+
+    def __init__(self, space):
+        self.space      = space
+        self.free       = []
+
+    def acquire(self, x, y, orientation, sprite):
+        """
+            Returns a bullet in the space, with the same arguments as the
+            constructor of Bullet (except the space).
+        """
+        if not self.free:
+            return Bullet(x, y, orientation, sprite, self.space)
+        bullet = self.free.pop()
+        bullet.rearm(x, y, orientation, sprite)
+        self.space.add(bullet.body, bullet.shape)
+        return bullet
+
+    def release(self, bullet):
+        """
+            Takes a bullet out of the space and keeps it for a later shot.
+            The bullet is removed at the end of the current step if the
+            space is being stepped.
+        """
+        self.space.remove(bullet.shape, bullet.body)
+        if len(self.free) < BulletPool.MAX_SIZE:
+            self.free.append(bullet)
+
+
 class Tank(GamePhysicsObject):
     """
         Extends GamePhysicsObject and handles aspects
@@ -202,8 +275,13 @@ class Tank(GamePhysicsObject):
     NORMAL_MAX_SPEED = 2.0
     FLAG_MAX_SPEED = NORMAL_MAX_SPEED * 0.5
 
-    def __init__(self, x, y, orientation, sprite, space):
+    def __init__(self, x, y, orientation, sprite, space, bullet_pool=None):
+        """
+            The bullets shot by the tank are taken from bullet_pool if it is
+            given, otherwise they are created.
+        """
         super().__init__(x, y, orientation, sprite, space, True)
+        self.bullet_pool          = bullet_pool
         # Define variable used to apply motion to the tanks
         self.acceleration         = 0.0
         self.velocity             = 0.0
@@ -321,14 +399,15 @@ class Tank(GamePhysicsObject):
     def shoot(self, space):
         """ Creates a bullet. """
         if self.cooldown == 0:
-            bullet = Bullet(self.body.position[0] - 0.6
-                            * math.sin(self.body.angle),
-                            self.body.position[1] + 0.6
-                            * math.cos(self.body.angle),
-                            self.body.angle,
-                            pygame.transform.rotate(images.bullet,
-                                              math.degrees(-self.body.angle)),
-                            space)
+            x = self.body.position[0] - 0.6 * math.sin(self.body.angle)
+            y = self.body.position[1] + 0.6 * math.cos(self.body.angle)
+            sprite = images.rotate(images.bullet,
+                                   math.degrees(-self.body.angle))
+            if self.bullet_pool is not None:
+                bullet = self.bullet_pool.acquire(x, y, self.body.angle,
+                                                  sprite)
+            else:
+                bullet = Bullet(x, y, self.body.angle, sprite, space)
             sound.shoot.set_volume(0.2)
             sound.shoot.play()
             self.cooldown = 20
@@ -346,11 +425,40 @@ class Box(GamePhysicsObject):
         super().__init__(x, y, 0, boxmodel.sprite, space, boxmodel.movable)
         self.boxmodel = boxmodel
         self.hp = 2
+        # The tile of the map where the box is
+        self.tile = (int(x), int(y))
+        # The tile where the box was placed at the start of the round
+        self.start_tile = self.tile
         if boxmodel.destructable is True:
             self.shape.collision_type = 3
         else:
             self.shape.collision_type = 4
 
+    def moved_tile(self):
+        """
+            Checks if the box has been pushed to another tile of the map. If
+            so, the new tile is remembered and the previous one is returned,
+            otherwise None is returned.
+        """
+        tile = (int(self.body.position[0]), int(self.body.position[1]))
+        if tile == self.tile:
+            return None
+        previous = self.tile
+        self.tile = tile
+        return previous
+
+    def reset(self):
+        """
+            Puts the box back where it was at the start of the round, still
+            and with its full hp.
+        """
+        self.hp = 2
+        self.tile = self.start_tile
+        self.body.position = self.tile[0] + 0.5, self.tile[1] + 0.5
+        self.body.velocity = 0, 0
+        self.body.angle = 0
+        self.body.angular_velocity = 0
+
 
 class GameVisibleObject(GameObject):
     """
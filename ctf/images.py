@@ -1,7 +1,13 @@
 """The file contains one function that loads images and other images. """
 
+import hashlib
 import pygame
 import os
+import weakref
+from collections import OrderedDict
+
+import assets
+import spritecache
 
 main_dir = os.path.split(os.path.abspath(__file__))[0]
 
@@ -19,30 +25,135 @@ def load_image(file):
 
 TILE_SIZE = 40   # Define the default size of tiles
 
-explosion = load_image('explosion.png')  # Image of an explosion
-explosion = pygame.transform.scale(explosion, (40, 40))
+ROTATION_STEP = 1   # Rotated sprites are cached by steps of this many degrees
+ROTATION_CACHE_SIZE = 128   # Maximum number of rotations kept per sprite
+
+# For every sprite, the rotated versions of it ordered from least to most
+# recently used. The sprites are weak keys: a sprite that is itself a
+# rotation (the bullets are rotated when they are shot, then again when they
+# are drawn) is forgotten with its rotations once nothing uses it anymore
+rotation_cache = weakref.WeakKeyDictionary()
+
+
+def rotate(sprite, angle):
+    """
+        Returns the sprite rotated by angle (in degrees), the angle is
+        rounded to ROTATION_STEP degrees. The rotations are read from the
+        sprite cache, or made and cached per sprite, so every object that
+        uses the same sprite also shares its rotations.
+    """
+    step = int(round(angle / ROTATION_STEP)) % (360 // ROTATION_STEP)
+    rotations = cached_rotations.get(sprite)
+    if rotations is not None:
+        # Prepared in advance, see spritecache.py
+        return rotations[step]
+    rotations = rotation_cache.get(sprite)
+    if rotations is None:
+        rotations = OrderedDict()
+        rotation_cache[sprite] = rotations
+    rotated = rotations.get(step)
+    if rotated is None:
+        rotated = pygame.transform.rotate(sprite, step * ROTATION_STEP)
+        rotations[step] = rotated
+        if len(rotations) > ROTATION_CACHE_SIZE:
+            # Forget the least recently used rotation
+            rotations.popitem(last=False)
+    else:
+        rotations.move_to_end(step)
+    return rotated
+
+
+COLORS = ["orange", "blue", "white", "yellow", "red", "gray"]
+
+# How each sprite is made from its image: the file, the size it is scaled to
+# (None to keep it), the angle it is rotated by, and whether it is drawn
+# rotated in the game, its rotations are then in the sprite cache too
+SPRITES = {"explosion": ('explosion.png', (40, 40), 0, False),
+           "grass": ('grass.png', None, 0, False),
+           "rockbox": ('rockbox.png', None, 0, False),
+           "metalbox": ('metalbox.png', None, 0, True),
+           "woodbox": ('woodbox.png', None, 0, True),
+           "flag": ('flag.png', None, 0, True),
+           # The bullet points up like the tanks
+           "bullet": ('bullet.png', (10, 10), -90, True)}
+for color in COLORS:
+    SPRITES["tank_" + color] = ('tank_%s.png' % color, None, 0, True)
+    SPRITES["base_" + color] = ('base_%s.png' % color, None, 0, False)
+
 
-grass     = load_image('grass.png')   # Image of a grass tile
+def prepare(name):
+    """ Makes the sprite name from its image file. """
+    file, size, angle, rotated = SPRITES[name]
+    sprite = load_image(file)
+    if size is not None:
+        sprite = pygame.transform.scale(sprite, size)
+    if angle != 0:
+        sprite = pygame.transform.rotate(sprite, angle)
+    return sprite
 
-rockbox   = load_image('rockbox.png')  # Image of a rock box (wall)
 
-metalbox  = load_image('metalbox.png')   # Image of a metal box
+def pixel_format():
+    """ Returns the masks of the sprites returned by convert_alpha. """
+    return pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks()
 
-woodbox   = load_image('woodbox.png')   # Image of a wood box
 
-flag      = load_image('flag.png')   # Image of flag
+def sprite_key(name):
+    """
+        Returns the key of the sprite name in the sprite cache: a hash of its
+        image file and of everything that changes how the sprite is made.
+    """
+    file, size, angle, rotated = SPRITES[name]
+    digest = hashlib.sha256()
+    with open(os.path.join(main_dir, 'data', file), 'rb') as file_handle:
+        digest.update(file_handle.read())
+    digest.update(repr((size, angle, rotated, ROTATION_STEP, pixel_format(),
+                        pygame.version.ver)).encode())
+    return digest.hexdigest()
+
+
+# The sprite cache, opened when the first sprite is loaded (False if there
+# is none or it can not be used)
+sprite_cache = None
+# For every sprite read from the sprite cache, its rotations
+cached_rotations = {}
+
+
+def load_sprite(name):
+    """
+        Returns the sprite name, from the sprite cache if it has it, otherwise
+        it is made from its image file.
+    """
+    global sprite_cache
+    if sprite_cache is None:
+        sprite_cache = False
+        if pixel_format() == spritecache.MASKS:
+            try:
+                sprite_cache = spritecache.SpriteCache()
+            except (OSError, ValueError):
+                pass
+    if sprite_cache:
+        rotations = sprite_cache.rotations(name, sprite_key(name))
+        if rotations is not None:
+            sprite = rotations[0]
+            if len(rotations) > 1:
+                cached_rotations[sprite] = rotations
+            return sprite
+    return prepare(name)
+
+
+def loader(name):
+    """ Returns a function that loads the sprite name. """
+    return lambda: load_sprite(name)
 
-bullet = load_image('bullet.png')
-bullet = pygame.transform.scale(bullet, (10, 10))
-bullet = pygame.transform.rotate(bullet, -90)
 
 # List of image of tanks of different colors
-tanks     = [load_image('tank_orange.png'), load_image('tank_blue.png'),
-             load_image('tank_white.png'), load_image('tank_yellow.png'),
-             load_image('tank_red.png'),  load_image('tank_gray.png')]
+tanks     = assets.LazyList([loader("tank_" + color) for color in COLORS])
 
 # List of image of bases corresponding to the color of each tank
-bases     = [load_image('base_orange.png'), load_image('base_blue.png'),
-             load_image('base_white.png'),
-             load_image('base_yellow.png'), load_image('base_red.png'),
-             load_image('base_gray.png')]
+bases     = assets.LazyList([loader("base_" + color) for color in COLORS])
+
+# The other sprites are loaded the first time they are used, as attributes of
+# this module (images.grass for instance)
+__getattr__ = assets.lazy_module(globals(), {
+    name: loader(name) for name in SPRITES
+    if not name.startswith(("tank_", "base_"))})
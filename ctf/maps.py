@@ -1,29 +1,69 @@
 """
    The file contains one map class with functions and three maps. The class is
    an instance blueprint for how the game map will look.
+
+   Maps are written in a text format, and can be compiled to a binary format
+   that loads without parsing anything: a header, the start positions of
+   the tanks and the position of the flag, then the boxes of the tiles as
+   one byte each. The file is mapped in memory and the boxes are read from
+   it directly. A map is compiled next to its text file with:
+       python3 maps.py map0.txt
 """
 
+import mmap
+import os
+import struct
+import sys
+
+import assets
 import images
+import numpy
 import pygame
 import pymunk
 
+main_dir = os.path.split(os.path.abspath(__file__))[0]
+
+# The cost of a tile that can not be driven through, a cost no tile can
+# have, so that any cost of ai.TILE_COSTS (0 included) stays passable
+IMPASSABLE = -1
+
+MAGIC = b"CTFM"
+VERSION = 1
+# magic, version, width, height, number of start positions
+HEADER = struct.Struct("<4sBIIH")
+START_POSITION = struct.Struct("<3d")   # x, y, orientation
+FLAG_POSITION = struct.Struct("<2d")    # x, y
+TEXT_EXTENSION = ".txt"
+COMPILED_EXTENSION = ".map"
+
 
 class Map:
     """ An instance of Map is a blueprint for how the game map will look. """
 
     def __init__(self,  width,  height,  boxes,  start_positions,
-                 flag_position):
+                 flag_position, initial_boxes=None):
         """
             Takes as argument the size of the map (width, height),
             an array with the boxes type, the start position of tanks
             (start_positions) and the position of the
-            flag (flag_position).
+            flag (flag_position). initial_boxes are the boxes at the start
+            of a round if they are already in an array that is not changed,
+            otherwise they are copied from boxes.
         """
         self.width              = width
         self.height             = height
-        self.boxes              = boxes
+        # The type of box of every tile, indexed as boxes[y, x]
+        self.boxes              = numpy.asarray(boxes, dtype=numpy.int8)
+        # The boxes at the start of a round, since boxes can be destroyed and
+        # pushed during the game
+        self.initial_boxes      = initial_boxes
+        if initial_boxes is None:
+            self.initial_boxes = self.boxes.copy()
         self.start_positions    = start_positions
         self.flag_position      = flag_position
+        # Increased every time a tile changes, so that what is computed from
+        # the boxes knows when it is outdated
+        self.version            = 0
 
     def rect(self):
         """Draws window size to. """
@@ -32,12 +72,69 @@ class Map:
 
     def boxAt(self, x, y):
         """ Return the type of the box at coordinates (x, y). """
-        return self.boxes[y][x]
+        return int(self.boxes[y, x])
+
+    def set_box(self, x, y, box_type):
+        """ Changes the type of the box at coordinates (x, y). """
+        if self.boxes[y, x] != box_type:
+            self.boxes[y, x] = box_type
+            self.version += 1
+
+    def reset_boxes(self):
+        """ Puts back the boxes as they were at the start of the game. """
+        if not numpy.array_equal(self.boxes, self.initial_boxes):
+            self.boxes[:] = self.initial_boxes
+            self.version += 1
+
+    def passable(self, box_types):
+        """
+            Returns a mask of the map, True for the tiles whose box type is
+            one of box_types.
+        """
+        return numpy.isin(self.boxes, list(box_types))
+
+    def tiles_with_box(self):
+        """
+            Returns the (x, y, box_type) of every tile that has a box, column
+            by column. The boxes are created in that order, which the physics
+            engine depends on.
+        """
+        xs, ys = numpy.nonzero(self.boxes.T)
+        return zip(xs.tolist(), ys.tolist(), self.boxes[ys, xs].tolist())
+
+    def neighbors(self, index):
+        """
+            Returns the four bordering tiles of a tile that are in the map.
+            Tiles are given as flat indices, the tile (x, y) is at index
+            y * width + x.
+        """
+        x, y = index % self.width, index // self.width
+        if x > 0:
+            yield index - 1
+        if x < self.width - 1:
+            yield index + 1
+        if y > 0:
+            yield index - self.width
+        if y < self.height - 1:
+            yield index + self.width
+
+    def cost_grid(self, tile_costs):
+        """
+            Returns the cost of entering every tile as a flat list, the tile
+            (x, y) is at index y * width + x. tile_costs maps a box type to
+            its cost, box types that are not in it give IMPASSABLE.
+        """
+        lookup = numpy.full(256, IMPASSABLE, dtype=numpy.int32)
+        for box_type, cost in tile_costs.items():
+            lookup[box_type] = cost
+        return lookup[self.boxes.ravel().astype(numpy.uint8)].tolist()
 
 
 def readmap(file):
-    """A function that reads a map from a text file."""
-    map_list = []
+    """
+        A function that reads a map from a text file. The rows of boxes are
+        parsed straight into the array of the map, one line at a time.
+    """
     tank_list = []
 
     with open(file, 'r') as file_handle:
@@ -45,11 +142,14 @@ def readmap(file):
         lstr = line.split()
         width = int(lstr[0])
         height = int(lstr[1])
+        boxes = numpy.empty((height, width), dtype=numpy.int8)
         for i in range(height):
-            line = file_handle.readline()
-            lstr = line.split()
-            lint = [int(elem) for elem in lstr]
-            map_list.append(lint)
+            row = numpy.fromstring(file_handle.readline(), dtype=numpy.int8,
+                                   sep=" ")
+            if row.size != width:
+                raise ValueError('row %d of "%s" has %d tiles instead of %d'
+                                 % (i, file, row.size, width))
+            boxes[i] = row
         while True:
             line = file_handle.readline()
             lstr = line.split()
@@ -59,10 +159,108 @@ def readmap(file):
                 break
             lint = [float(elem) for elem in lstr]
             tank_list.append(lint)
-    map = Map(width, height, map_list, tank_list, flag_list)
+    map = Map(width, height, boxes, tank_list, flag_list)
     return map
 
 
-map0 = readmap("map0.txt")
-map1 = readmap("map1.txt")
-map2 = readmap("map2.txt")
+def writemap(map, file):
+    """ A function that writes a map in the compiled format. """
+    # Written next to the map then renamed, so that the game never maps a
+    # file that is only partly written
+    temporary = file + ".tmp"
+    with open(temporary, 'wb') as file_handle:
+        file_handle.write(HEADER.pack(MAGIC, VERSION, map.width, map.height,
+                                      len(map.start_positions)))
+        for position in map.start_positions:
+            file_handle.write(START_POSITION.pack(*position))
+        file_handle.write(FLAG_POSITION.pack(*map.flag_position))
+        file_handle.write(map.initial_boxes.tobytes())
+    os.replace(temporary, file)
+
+
+def loadmap(file):
+    """
+        A function that loads a map in the compiled format. Nothing is
+        copied: the boxes at the start of a round are read from the file,
+        and the boxes of the game are a private mapping of it, only the
+        pages where boxes change are copied in memory.
+    """
+    with open(file, 'rb') as file_handle:
+        data = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        boxes = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_COPY)
+    try:
+        magic, version, width, height, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('"%s" is not a compiled map of this version'
+                             % file)
+        offset = HEADER.size
+        start_positions = []
+        for i in range(count):
+            start_positions.append(
+                list(START_POSITION.unpack_from(data, offset)))
+            offset += START_POSITION.size
+        flag_position = list(FLAG_POSITION.unpack_from(data, offset))
+        offset += FLAG_POSITION.size
+    except struct.error:
+        # The file ends before the positions
+        raise ValueError('"%s" is damaged' % file)
+    if len(data) != offset + width * height:
+        raise ValueError('"%s" is damaged' % file)
+    return Map(width, height,
+               numpy.frombuffer(boxes, numpy.int8, width * height,
+                                offset).reshape(height, width),
+               start_positions, flag_position,
+               numpy.frombuffer(data, numpy.int8, width * height,
+                                offset).reshape(height, width))
+
+
+def compilemap(file):
+    """
+        A function that compiles a text map, the compiled map is written next
+        to it. Returns the path of the compiled map.
+    """
+    compiled = os.path.splitext(file)[0] + COMPILED_EXTENSION
+    writemap(readmap(file), compiled)
+    return compiled
+
+
+def load(name):
+    """
+        Loads a map by name: the compiled map in the ctf folder if it is up
+        to date, otherwise the text map. name can also be the path of a
+        map file, from the current folder.
+    """
+    path = name
+    if os.path.dirname(name) == "" and not os.path.exists(name):
+        # The name of a map of the ctf folder
+        path = os.path.join(main_dir, name)
+    if name.endswith(COMPILED_EXTENSION):
+        return loadmap(path)
+    if name.endswith(TEXT_EXTENSION):
+        return readmap(path)
+    text = path + TEXT_EXTENSION
+    compiled = path + COMPILED_EXTENSION
+    if os.path.exists(compiled) and (
+            not os.path.exists(text)
+            or os.path.getmtime(compiled) >= os.path.getmtime(text)):
+        return loadmap(compiled)
+    return readmap(text)
+
+
+def loader(name):
+    """ Returns a function that loads the map name of the ctf folder. """
+    return lambda: load(name)
+
+
+# The maps are loaded the first time they are used (maps.map0 for instance)
+__getattr__ = assets.lazy_module(globals(), {
+    "map0": loader("map0"),
+    "map1": loader("map1"),
+    "map2": loader("map2")})
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python3 maps.py MAP.txt...")
+    for file in sys.argv[1:]:
+        print("Compiled", file, "to", compilemap(file))
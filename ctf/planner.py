@@ -0,0 +1,163 @@
+"""
+    The file contains the path searches of the ai and the path planner, a
+    pool of worker processes that runs them outside of the main loop. The
+    searches only read a copy of the costs of the tiles, and the file does
+    not import the game, so that the workers stay small.
+
+    A search is a generator that pauses (yields) every SEARCH_STEP tiles and
+    returns its result, so that it can also be spread over several ticks in
+    the main loop, see finish.
+"""
+
+import multiprocessing
+import time
+from heapq import heappush, heappop
+
+SEARCH_STEP = 64   # Tiles searched between two pauses of a search
+# The cost of the tiles that can not be entered, the same as maps.IMPASSABLE
+IMPASSABLE = -1
+
+
+def finish(search, deadline=None):
+    """
+        Runs a search until it is over or until time.perf_counter() reaches
+        the deadline. Returns the result of the search, or None if it has to
+        go on later.
+    """
+    while True:
+        try:
+            next(search)
+        except StopIteration as over:
+            return over.value
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+
+
+def neighbors(index, width, height):
+    """
+        Returns the four bordering tiles of a tile that are in the map, in
+        the same order as maps.Map.neighbors.
+    """
+    x, y = index % width, index // width
+    if x > 0:
+        yield index - 1
+    if x < width - 1:
+        yield index + 1
+    if y > 0:
+        yield index - width
+    if y < height - 1:
+        yield index + width
+
+
+def shortest_path(costs, width, height, start, goal, min_cost):
+    """
+        An A* search using integer tile indices (y * width + x) as our
+        nodes and the manhattan distance as heuristic. costs gives the cost
+        of entering each tile and min_cost the cheapest of them, which keeps
+        the heuristic from overestimating. Returns the tiles of the path from
+        the goal back to the tile after start (the next step is the last
+        one), the list is empty if the goal can not be reached.
+    """
+    goal_x, goal_y = goal % width, goal // width
+    parent = {start: None}
+    cost_so_far = {start: 0}
+    heap = [(0, 0, start)]
+    searched = 0
+    while heap:
+        searched += 1
+        if searched % SEARCH_STEP == 0:
+            yield
+        estimate, remaining, node = heappop(heap)
+        if node == goal:
+            break
+        cost = cost_so_far[node]
+        if estimate > cost + remaining:
+            continue   # An outdated entry, the node was reached cheaper
+        x, y = node % width, node // width
+        for neighbor, nx, ny in ((node - 1, x - 1, y), (node + 1, x + 1, y),
+                                 (node - width, x, y - 1),
+                                 (node + width, x, y + 1)):
+            if nx < 0 or nx >= width or ny < 0 or ny >= height or \
+               costs[neighbor] == IMPASSABLE:
+                continue
+            new_cost = cost + costs[neighbor]
+            if new_cost < cost_so_far.get(neighbor, new_cost + 1):
+                cost_so_far[neighbor] = new_cost
+                parent[neighbor] = node
+                remaining = min_cost * (abs(goal_x - nx) + abs(goal_y - ny))
+                heappush(heap, (new_cost + remaining, remaining, neighbor))
+
+    path = []
+    if goal not in parent:
+        return path
+    node = goal
+    while node != start:
+        path.append(node)
+        node = parent[node]
+    return path
+
+
+def flow_field(costs, width, height, target):
+    """
+        Computes the flow field towards the target tile, see flowfield.py.
+        Returns two dictionaries: the next tile on the cheapest path to the
+        target and the cost of that path, for every tile that can reach it.
+    """
+    # Dijkstra's algorithm from the target. Moves go both ways, so the
+    # parent of a tile in the search is the next step from it, and the
+    # cost of a move is the cost of entering the parent.
+    next_tile = {target: None}
+    cost_to_target = {target: 0}
+    heap = [(0, target)]
+    if costs[target] == IMPASSABLE:
+        heap.clear()
+    searched = 0
+    while heap:
+        searched += 1
+        if searched % SEARCH_STEP == 0:
+            yield
+        cost, node = heappop(heap)
+        if cost > cost_to_target[node]:
+            continue
+        cost += costs[node]
+        for neighbor in neighbors(node, width, height):
+            if costs[neighbor] != IMPASSABLE and \
+               cost < cost_to_target.get(neighbor, cost + 1):
+                cost_to_target[neighbor] = cost
+                next_tile[neighbor] = node
+                heappush(heap, (cost, neighbor))
+    return next_tile, cost_to_target
+
+
+def run(search, *arguments):
+    """ Runs a whole search in a worker and returns its result. """
+    return finish(search(*arguments))
+
+
+class PathPlanner:
+    """
+        A pool of worker processes that run the searches of the ai. A search
+        is submitted with a copy of what it reads (the costs of the tiles,
+        the start and the target), and its result is picked up on a later
+        tick, meanwhile the ai keeps following its current path.
+
+        The workers are made by forking the game, it should be created
+        before pygame starts its threads. Raises ValueError when the system
+        can not fork processes.
+    """
+
+    def __init__(self, workers):
+        context = multiprocessing.get_context("fork")
+        self.pool           = context.Pool(workers)
+
+    def submit(self, search, *arguments):
+        """
+            Starts search(*arguments) in a worker, returns a
+            multiprocessing.pool.AsyncResult holding its result.
+        """
+        return self.pool.apply_async(run, (search,) + arguments)
+
+    def close(self):
+        """ Stops the workers, the searches still going on are dropped. """
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,337 @@
+"""
+    The file contains the renderer, which draws the game objects on the
+    screen. Only the parts of the screen that changed since the last frame
+    are redrawn and sent to the display. When the map is larger than the
+    screen, the screen shows the part of the map seen by a camera that
+    follows the players, and only what is in that part is drawn.
+"""
+
+import gameobjects
+import images
+import pygame
+import pymunk
+
+CHUNK_TILES = 8   # Width and height of the chunks of the background, in tiles
+# How far from the view an object can be and still be drawn, in pixels: the
+# sprites of objects centred outside the view can overlap its border
+CULL_MARGIN = 2 * images.TILE_SIZE
+# Share of the view in which the followed objects can move without moving
+# the camera, horizontally and vertically
+DEAD_ZONE = 0.5
+
+
+class Camera:
+    """
+        The part of the map shown on the screen. Positions on the map are in
+        pixels, like the positions on the screen, the view is the rectangle
+        of the map on the screen. The camera keeps the objects it follows in
+        the middle part of the view (see DEAD_ZONE) and never shows anything
+        outside of the map.
+    """
+
+    def __init__(self, view_size, map_size, targets=()):
+        """
+            view_size is the size of the screen, map_size the size of the map
+            in pixels and targets the objects followed by the camera.
+        """
+        self.view           = pygame.Rect((0, 0), view_size)
+        self.map_rect       = pygame.Rect((0, 0), map_size)
+        self.targets        = list(targets)
+
+    def offset(self):
+        """ Returns the position of the top left corner of the view. """
+        return self.view.topleft
+
+    def follow(self, positions):
+        """ Moves the view so that it keeps the positions in its middle. """
+        if not positions:
+            return
+        x = sum(position[0] for position in positions) / len(positions)
+        y = sum(position[1] for position in positions) / len(positions)
+        zone = self.view.inflate(-self.view.width * (1 - DEAD_ZONE),
+                                 -self.view.height * (1 - DEAD_ZONE))
+        dx = min(x - zone.left, 0) + max(x - zone.right, 0)
+        dy = min(y - zone.top, 0) + max(y - zone.bottom, 0)
+        self.view.move_ip(int(dx), int(dy))
+        self.view.clamp_ip(self.map_rect)
+
+    def visible_area(self):
+        """
+            Returns the rectangle of the map where the objects are drawn: the
+            view and a margin of CULL_MARGIN around it.
+        """
+        return self.view.inflate(2 * CULL_MARGIN, 2 * CULL_MARGIN)
+
+
+class Background:
+    """
+        The background of the map: the grass and the boxes that never move.
+        It is drawn in square chunks of CHUNK_TILES tiles, a chunk is drawn
+        the first time it is seen, and the chunks far from the view are
+        dropped, so the memory used depends on the size of the screen and
+        not on the size of the map.
+    """
+
+    def __init__(self, map_size, static_boxes):
+        """
+            map_size is the size of the map in pixels and static_boxes the
+            boxes drawn on the background.
+        """
+        self.map_rect       = pygame.Rect((0, 0), map_size)
+        self.chunk_size     = CHUNK_TILES * images.TILE_SIZE
+        # The static boxes of each chunk, by chunk coordinates
+        self.boxes          = {}
+        for box in static_boxes:
+            chunk = (box.tile[0] // CHUNK_TILES, box.tile[1] // CHUNK_TILES)
+            self.boxes.setdefault(chunk, []).append(box)
+        # The surfaces of the chunks drawn so far, by chunk coordinates
+        self.chunks         = {}
+
+    def chunk(self, chunk):
+        """ Returns the surface of a chunk, given by its coordinates. """
+        surface = self.chunks.get(chunk)
+        if surface is None:
+            rect = self.chunk_rect(chunk)
+            surface = pygame.Surface(rect.size)
+            grass = images.grass
+            for y in range(0, rect.height, images.TILE_SIZE):
+                for x in range(0, rect.width, images.TILE_SIZE):
+                    surface.blit(grass, (x, y))
+            for box in self.boxes.get(chunk, ()):
+                box.update_screen(surface,
+                                  box.screen_position() - rect.topleft)
+            self.chunks[chunk] = surface
+        return surface
+
+    def chunk_rect(self, chunk):
+        """ Returns the rectangle of the map covered by a chunk. """
+        return pygame.Rect(chunk[0] * self.chunk_size,
+                           chunk[1] * self.chunk_size,
+                           self.chunk_size, self.chunk_size).clip(
+                               self.map_rect)
+
+    def chunks_in(self, area):
+        """ Returns the coordinates of the chunks that overlap area. """
+        area = area.clip(self.map_rect)
+        for y in range(area.top // self.chunk_size,
+                       (area.bottom - 1) // self.chunk_size + 1):
+            for x in range(area.left // self.chunk_size,
+                           (area.right - 1) // self.chunk_size + 1):
+                yield x, y
+
+    def draw(self, screen, area, offset):
+        """
+            Draws the background of area, a rectangle of the screen, the top
+            left corner of the screen being at offset on the map.
+        """
+        map_area = area.move(offset)
+        for chunk in self.chunks_in(map_area):
+            rect = self.chunk_rect(chunk)
+            part = map_area.clip(rect)
+            screen.blit(self.chunk(chunk), part.move(-offset[0], -offset[1]),
+                        part.move(-rect.x, -rect.y))
+
+    def forget_outside(self, view):
+        """ Drops the chunks that are more than one chunk away from view. """
+        keep = set(self.chunks_in(view.inflate(2 * self.chunk_size,
+                                               2 * self.chunk_size)))
+        for chunk in list(self.chunks):
+            if chunk not in keep:
+                del self.chunks[chunk]
+
+
+class Renderer:
+    """
+        Draws the background and the game objects on the screen. The
+        background holds everything that never changes (the grass and the
+        immovable boxes). The renderer remembers where every object was
+        drawn, so on the next frame it only restores the background behind
+        the objects that moved, rotated, appeared or disappeared, redraws what
+        overlaps those areas, and updates these rectangles of the display.
+        Frames drawn between two ticks of the game show the objects between
+        their positions before and after the last tick.
+    """
+
+    def __init__(self, screen, background, full_redraw=False, camera=None,
+                 space=None):
+        """
+            Takes as arguments the screen to draw on, the Background, whether
+            every frame should be redrawn entirely (full_redraw), the Camera,
+            which by default shows the top left of the map without moving,
+            and the physics space, which finds the physics objects in view
+            without going through all of them.
+        """
+        self.screen         = screen
+        self.background     = background
+        self.full_redraw    = full_redraw
+        if camera is None:
+            camera = Camera(screen.get_size(), background.map_rect.size)
+        self.camera         = camera
+        self.space          = space
+        # Where the view was on the map on the last frame
+        self.offset         = None
+        # For each object: the sprite and the rectangle of the last frame
+        self.drawn          = {}
+        self.invalidated    = True
+        # For each object: the position and orientation before the last tick
+        self.previous       = {}
+        # The areas of the screen drawn since the display was last updated,
+        # None when the whole screen has to be sent
+        self.dirty          = []
+
+    def invalidate(self):
+        """
+            Makes the next frame a full redraw, for instance when something
+            else has been drawn on the screen.
+        """
+        self.invalidated = True
+
+    def in_view(self, game_objects):
+        """
+            Returns the game objects that may be in the visible area of the
+            camera, in the order they are drawn. With a space, game_objects
+            is the EntityRegistry and the physics objects are looked up in
+            the space, so the objects out of view are not gone through.
+        """
+        area = self.camera.visible_area()
+        if self.space is None or area.contains(self.camera.map_rect):
+            return game_objects
+        size = images.TILE_SIZE
+        bb = pymunk.BB(area.left / size, area.top / size, area.right / size,
+                       area.bottom / size)
+        near = set(game_objects.of_type(gameobjects.GameVisibleObject))
+        for shape in self.space.bb_query(bb, pymunk.ShapeFilter()):
+            # The walls around the map and the immovable boxes are not game
+            # objects
+            obj = getattr(shape, "parent", None)
+            if obj in game_objects:
+                near.add(obj)
+        return game_objects.in_order(near)
+
+    def save_states(self, game_objects):
+        """
+            Remembers where the objects in view are on the screen, it should
+            be called before every tick of the game.
+        """
+        self.previous = {obj: (obj.screen_position(), obj.screen_orientation())
+                         for obj in self.in_view(game_objects)}
+
+    def interpolate(self, obj, alpha):
+        """
+            Returns the position and orientation of an object on the screen
+            between the last two ticks, alpha going from 0 (the one before)
+            to 1 (the last one).
+        """
+        position = obj.screen_position()
+        orientation = obj.screen_orientation()
+        previous = self.previous.get(obj)
+        if previous is None or alpha >= 1:
+            return position, orientation
+        last_position, last_orientation = previous
+        if last_position.get_distance(position) > images.TILE_SIZE:
+            # The object has been moved at once (for instance a tank that
+            # respawned), it should not be seen sliding across the map
+            return position, orientation
+        # Turn the shortest way, in degrees
+        turn = (orientation - last_orientation + 180) % 360 - 180
+        return (last_position + (position - last_position) * alpha,
+                last_orientation + turn * alpha)
+
+    def draw(self, game_objects, alpha=1.0):
+        """
+            Draws a frame with the game objects on the screen, present then
+            shows it. alpha tells how far the frame is between the last two
+            ticks, see interpolate.
+        """
+        camera = self.camera
+        camera.follow([self.interpolate(target, alpha)[0]
+                       for target in camera.targets])
+        offset = camera.offset()
+        if offset != self.offset:
+            # Everything moved on the screen
+            self.offset = offset
+            self.invalidated = True
+
+        # Only the objects in view are drawn, with their position on the
+        # screen
+        visible_area = camera.visible_area()
+        states = {}
+        current = {}
+        for obj in self.in_view(game_objects):
+            position, orientation = self.interpolate(obj, alpha)
+            if not visible_area.collidepoint(position):
+                continue
+            states[obj] = (position - offset, orientation)
+            current[obj] = obj.screen_sprite(*states[obj])
+
+        if self.full_redraw or self.invalidated:
+            self.background.draw(self.screen, self.screen.get_rect(), offset)
+            self.background.forget_outside(camera.view)
+            for obj, state in states.items():
+                obj.update_screen(self.screen, *state)
+            self.dirty = None
+            self.drawn = current
+            self.invalidated = False
+            return
+
+        # Collect the areas where something changed since the last frame
+        dirty = []
+        for obj, (sprite, rect) in current.items():
+            last = self.drawn.get(obj)
+            if last is None:
+                dirty.append(rect)
+            elif last[0] is not sprite or last[1] != rect:
+                dirty.append(last[1])
+                dirty.append(rect)
+        for obj, (sprite, rect) in self.drawn.items():
+            if obj not in current:
+                dirty.append(rect)
+        self.drawn = current
+
+        dirty = merge_rects(dirty, self.screen.get_rect())
+        if self.dirty is not None:
+            self.dirty.extend(dirty)
+
+        for area in dirty:
+            # Restrict drawing to the area, so that the objects which only
+            # partly overlap it are not blended twice outside of it
+            self.screen.set_clip(area)
+            self.background.draw(self.screen, area, offset)
+            for obj, (sprite, rect) in current.items():
+                if rect.colliderect(area):
+                    obj.update_screen(self.screen, *states[obj])
+        self.screen.set_clip(None)
+
+    def mark_dirty(self, rect):
+        """
+            Tells that something else has been drawn on the screen in rect,
+            so that present shows it.
+        """
+        if self.dirty is not None:
+            self.dirty.append(rect)
+
+    def present(self):
+        """ Shows what has been drawn since the last call on the display. """
+        if self.dirty is None:
+            pygame.display.flip()
+        elif self.dirty:
+            pygame.display.update(self.dirty)
+        self.dirty = []
+
+
+def merge_rects(rects, bounds):
+    """
+        Clips the rectangles to bounds and merges the ones that overlap, so
+        that no area is drawn twice.
+    """
+    merged = []
+    for rect in rects:
+        rect = rect.clip(bounds)
+        if rect.width == 0 or rect.height == 0:
+            continue
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
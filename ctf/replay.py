@@ -0,0 +1,176 @@
+"""
+    The file contains the recording and the playback of matches. A replay is
+    a compact binary file with:
+    - a header with what is needed to set up the match again (map, seed,
+      tick rate and who plays),
+    - the actions of the players, at the tick they happened,
+    - keyframes with the whole state of the game every few ticks, so that a
+      match can be watched from any tick without simulating it from the
+      start.
+    Since the game is deterministic, the ai does not have to be recorded.
+"""
+
+import collections
+import struct
+import zlib
+
+MAGIC = b"CTFR"
+VERSION = 3
+KEYFRAME_INTERVAL = 500   # Default number of ticks between two keyframes
+
+# Player modes of ctf.py, stored as their index
+PLAYER_MODES = ("", "singleplayer", "hot multiplayer")
+
+# Types of the records that follow the header
+ACTION = 1
+KEYFRAME = 2
+END = 3
+
+# magic, version, seed, has a seed, tick rate, player mode, all tanks are
+# controlled by the ai, ticks between keyframes, length of the map name
+HEADER = struct.Struct("<4sBiBHBBIB")
+TICK = struct.Struct("<I")
+KEYFRAME_HEADER = struct.Struct("<II")   # tick, length of the state
+
+Header = collections.namedtuple("Header", ["map", "seed", "tick_rate",
+                                           "player_mode", "all_ai",
+                                           "keyframe_interval"])
+
+
+def write_varint(file_handle, value):
+    """ Writes a positive integer on as few bytes as possible. """
+    while value >= 0x80:
+        file_handle.write(bytes((value & 0x7f | 0x80,)))
+        value >>= 7
+    file_handle.write(bytes((value,)))
+
+
+def read_varint(data, offset):
+    """ Reads an integer written by write_varint, returns it and the offset
+        after it. """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class Recorder:
+    """
+        Writes a replay while the match is played. Records are written as
+        they come, so the replay is usable up to the last keyframe even if
+        the game crashes.
+    """
+
+    def __init__(self, path, header):
+        self.file_handle    = open(path, "wb")
+        self.header         = header
+        self.last_tick      = 0   # Tick of the last action
+        map_name = header.map.encode()
+        self.file_handle.write(HEADER.pack(
+            MAGIC, VERSION, header.seed or 0, header.seed is not None,
+            header.tick_rate, PLAYER_MODES.index(header.player_mode),
+            header.all_ai, header.keyframe_interval, len(map_name)))
+        self.file_handle.write(map_name)
+
+    def action(self, tick, player, action):
+        """
+            Records the action of a player, applied before the tick after
+            tick (tick is the number of ticks already run).
+        """
+        self.file_handle.write(bytes((ACTION,)))
+        write_varint(self.file_handle, tick - self.last_tick)
+        self.file_handle.write(bytes((player << 4 | action,)))
+        self.last_tick = tick
+
+    def keyframe(self, tick, state):
+        """
+            Records the state of the game after tick ticks, a snapshot from
+            snapshot.Snapshotter.
+        """
+        state = zlib.compress(state)
+        self.file_handle.write(bytes((KEYFRAME,)))
+        self.file_handle.write(KEYFRAME_HEADER.pack(tick, len(state)))
+        self.file_handle.write(state)
+        self.file_handle.flush()
+
+    def close(self, tick):
+        """ Ends the replay, the match lasted tick ticks. """
+        self.file_handle.write(bytes((END,)))
+        self.file_handle.write(TICK.pack(tick))
+        self.file_handle.close()
+
+
+class Replay:
+    """ Reads a replay written by Recorder. """
+
+    def __init__(self, path):
+        with open(path, "rb") as file_handle:
+            data = file_handle.read()
+        if len(data) < HEADER.size:
+            raise ValueError('"%s" is not a replay of this version' % path)
+        (magic, version, seed, has_seed, tick_rate, player_mode, all_ai,
+         keyframe_interval, name_length) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('"%s" is not a replay of this version' % path)
+        offset = HEADER.size
+        map_name = data[offset:offset + name_length].decode()
+        offset += name_length
+        self.header = Header(map_name, seed if has_seed else None, tick_rate,
+                             PLAYER_MODES[player_mode], bool(all_ai),
+                             keyframe_interval)
+
+        # For each tick, the (player, action) applied before the next tick
+        self.actions = collections.defaultdict(list)
+        # For each tick with a keyframe, the compressed state of the game
+        self.keyframes = {}
+        self.end_tick = None   # None if the recording was interrupted
+        tick = 0
+        while offset < len(data):
+            record = data[offset]
+            offset += 1
+            # A record that runs past the end of the file was cut short by
+            # an interrupted recording, it is dropped with the rest
+            try:
+                if record == ACTION:
+                    delta, offset = read_varint(data, offset)
+                    action = data[offset]
+                    offset += 1
+                    tick += delta
+                    self.actions[tick].append((action >> 4, action & 0x0f))
+                elif record == KEYFRAME:
+                    keyframe_tick, length = KEYFRAME_HEADER.unpack_from(
+                        data, offset)
+                    offset += KEYFRAME_HEADER.size
+                    if offset + length > len(data):
+                        break
+                    self.keyframes[keyframe_tick] = \
+                        data[offset:offset + length]
+                    offset += length
+                elif record == END:
+                    self.end_tick = TICK.unpack_from(data, offset)[0]
+                    offset += TICK.size
+                else:
+                    raise ValueError('"%s" is damaged at byte %d'
+                                     % (path, offset))
+            except (IndexError, struct.error):
+                break
+        if not self.keyframes:
+            raise ValueError('"%s" was interrupted before its first keyframe'
+                             % path)
+        if self.end_tick is None:
+            # Only what is covered by a keyframe is complete
+            self.end_tick = max(self.keyframes)
+
+    def keyframe(self, tick):
+        """ Returns the state of the game recorded after tick ticks. """
+        return zlib.decompress(self.keyframes[tick])
+
+    def keyframe_before(self, tick):
+        """ Returns the last keyframe at or before tick, as (tick, state). """
+        keyframe_tick = max(t for t in self.keyframes if t <= tick)
+        return keyframe_tick, self.keyframe(keyframe_tick)
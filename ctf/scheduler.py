@@ -0,0 +1,99 @@
+"""
+    The file contains the scheduler of the ai, which tells which ai decide
+    on each tick. Without a budget every ai decides on every tick. With a
+    budget, the ai decide one after the other until the time given to them
+    for the tick is spent, and the next tick starts with the ones left out.
+    The ai far from the other tanks and from the flag decide less often
+    between two moves, and a path search that is not over when the time is spent goes on at
+    the next decision of its ai (see Ai.move).
+
+    The decisions then depend on how fast the computer is, so a match
+    played with a budget can not be recorded or replayed.
+"""
+
+import time
+
+import ai
+
+FAR_DISTANCE = 8   # Tiles between an ai and the rest of the match to be far
+FAR_INTERVAL = 4   # Ticks between two decisions of an ai far from the rest
+
+
+class AiScheduler:
+    """
+        Runs the decisions of the ai of a match. The ai take turns to decide
+        first, so that when the budget is too small for all of them, the
+        same ones are not always left out.
+    """
+
+    def __init__(self, ai_list, tanks_list, flag, budget=None):
+        """
+            budget is the time given to the ai on each tick in milliseconds,
+            None to let every ai decide on every tick.
+        """
+        self.ai_list        = ai_list
+        self.tanks_list     = tanks_list
+        self.flag           = flag
+        self.budget         = budget
+        self.first          = 0    # Index of the ai that decides first
+        self.waited         = {}   # Ticks since the last decision of each ai
+
+    def decide(self):
+        """ Runs the decisions of one tick. """
+        if self.budget is None:
+            for ai_player in self.ai_list:
+                ai_player.decide()
+            return
+        count = len(self.ai_list)
+        if count == 0:
+            return
+        deadline = time.perf_counter() + self.budget / 1000
+        positions = None
+        due = []
+        for i in range(count):
+            ai_player = self.ai_list[(self.first + i) % count]
+            waited = self.waited.get(ai_player, 0) + 1
+            self.waited[ai_player] = waited
+            if ai_player.move_step not in (ai.NEW_MOVE, ai.ARRIVED):
+                # Only a decision stops a turn or a drive, the tank would
+                # turn or drive too far if it waited
+                self.run(ai_player, deadline)
+                continue
+            if waited < FAR_INTERVAL:
+                if positions is None:
+                    positions = [tank.body.position
+                                 for tank in self.tanks_list]
+                if self.far_from_action(ai_player, positions):
+                    continue
+            due.append(ai_player)
+        for i, ai_player in enumerate(due):
+            # At least one ai decides on each tick, even out of time
+            if i > 0 and time.perf_counter() >= deadline:
+                self.first = self.ai_list.index(ai_player)
+                return
+            self.run(ai_player, deadline)
+        self.first = (self.first + 1) % count
+
+    def run(self, ai_player, deadline):
+        """ Lets ai_player decide, its path search stops at deadline. """
+        ai_player.decide(deadline)
+        self.waited[ai_player] = 0
+
+    def far_from_action(self, ai_player, positions):
+        """
+            Tells if the tank of ai_player is further than FAR_DISTANCE from
+            every other tank and from the flag, and does not carry it.
+            positions are the positions of the tanks of tanks_list.
+        """
+        tank = ai_player.tank
+        if tank.flag is not None:
+            return False
+        limit = FAR_DISTANCE ** 2
+        x, y = positions[self.tanks_list.index(tank)]
+        if (x - self.flag.x) ** 2 + (y - self.flag.y) ** 2 <= limit:
+            return False
+        for other, (other_x, other_y) in zip(self.tanks_list, positions):
+            if other is not tank and \
+               (x - other_x) ** 2 + (y - other_y) ** 2 <= limit:
+                return False
+        return True
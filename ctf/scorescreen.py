@@ -0,0 +1,82 @@
+"""
+    The file contains the score screen, shown between two rounds. It is a
+    state of the main loop: while it is shown, the main loop draws it at the
+    framerate of the game instead of running ticks, until h is pressed or,
+    if there is a timeout, until the time is up.
+"""
+
+import pygame
+
+FONT_SIZE = 16
+LINE_HEIGHT = 20
+BLUE = (0, 0, 128)
+WHITE = (255, 255, 255)
+CAPTION = 'Score of the Players'
+
+# The font of the score screen, loaded the first time it is shown
+font = None
+
+
+def render(text):
+    """ Returns a surface with text written in the font of the screen. """
+    global font
+    if font is None:
+        font = pygame.font.Font('freesansbold.ttf', FONT_SIZE)
+    return font.render(text, True, BLUE)
+
+
+class ScoreScreen:
+    """
+        The score of the players, the text is rendered once when the screen
+        is created. With a timeout, the last line counts down the seconds
+        left and is only rendered again when that number changes.
+    """
+
+    def __init__(self, lines, timeout=None):
+        """
+            lines are the lines of text to show, timeout the number of seconds
+            after which the game continues by itself (None to wait for h).
+        """
+        self.lines          = [render(line) for line in lines]
+        self.timeout        = timeout
+        self.shown          = 0.0   # Seconds the screen has been shown
+        self.seconds_left   = None
+        self.prompt         = None
+        self.update_prompt()
+        self.previous_caption = pygame.display.get_caption()[0]
+        pygame.display.set_caption(CAPTION)
+
+    def update_prompt(self):
+        """ Renders the last line again if its text changed. """
+        if self.timeout is None:
+            if self.prompt is None:
+                self.prompt = render("Press h to continue...")
+            return
+        seconds_left = max(0, int(self.timeout - self.shown + 0.999))
+        if seconds_left != self.seconds_left:
+            self.seconds_left = seconds_left
+            self.prompt = render("Press h to continue (%d s)..."
+                                 % seconds_left)
+
+    def handle_event(self, event):
+        """ Returns True if event closes the screen. """
+        return event.type == pygame.KEYDOWN and event.key == pygame.K_h
+
+    def update(self, seconds):
+        """
+            Counts seconds more of being shown, returns True when the timeout
+            is over.
+        """
+        self.shown += seconds
+        self.update_prompt()
+        return self.timeout is not None and self.shown >= self.timeout
+
+    def draw(self, screen):
+        """ Draws the score over the whole screen. """
+        screen.fill(WHITE)
+        for i, text in enumerate(self.lines + [self.prompt]):
+            screen.blit(text, text.get_rect(center=(150, 60 + i * LINE_HEIGHT)))
+
+    def close(self):
+        """ Gives the window its caption back. """
+        pygame.display.set_caption(self.previous_caption)
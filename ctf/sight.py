@@ -0,0 +1,188 @@
+"""
+    The file contains the line of sight of the tanks: what a bullet shot by
+    a tank right now would hit first. The ai only shoots at tanks and wooden
+    boxes, so the physics engine only has to be asked when one of them is
+    near the line of fire. That is found without it: the line is walked
+    through the tiles of the map up to the first rock box, looking for
+    tiles near a wooden box, and it is compared with the few tanks.
+"""
+
+import math
+
+import numpy
+import pymunk
+
+import boxmodels
+
+SIGHT_START = 0.6   # Where the line starts, from the centre of the tank
+SIGHT_END = 10      # Where the line ends, from the centre of the tank
+# Finds every shape, it is made once instead of for every query
+SHAPE_FILTER = pymunk.ShapeFilter()
+MARGIN = 0.01       # Added to the reach of the shapes, against rounding
+
+
+class LineOfSight:
+    """
+        Finds what the tanks have in their line of fire. It is shared by all
+        the ai: the tiles near a wooden box are worked out once per change
+        of the map, and the results and where the tanks are kept from one
+        call of new_tick to the next, so each tank is looked at once per
+        tick. Without calls to new_tick nothing is kept.
+
+        The lines are not worked out for all the tanks at once: each ai
+        only asks for the line of its own tank, and not while the tank cools
+        down or when the scheduler skips the ai, so a batch would mostly
+        compute lines that nobody uses.
+    """
+
+    def __init__(self, space, currentmap, tanks_list):
+        self.space          = space
+        self.currentmap     = currentmap
+        self.tanks_list     = tanks_list
+        box_types = range(1, 4)
+        # The boxes that stop the line and never move, and the ones that can
+        # be shot at
+        self.wall_types     = [box_type for box_type in box_types
+                               if not boxmodels.get_model(box_type).movable]
+        self.target_types   = [box_type for box_type in box_types
+                               if boxmodels.get_model(box_type).destructable]
+        self.walls          = currentmap.passable(self.wall_types).tolist()
+        self.near_targets   = None
+        self.map_version    = None
+        self.caching        = False
+        self.hits           = {}
+        self.extents        = None
+
+    def new_tick(self):
+        """ Forgets the results and the tanks of the last tick. """
+        self.caching = True
+        self.hits.clear()
+        self.extents = None
+
+    def tank_extents(self):
+        """
+            Returns for each tank the centre of its shape, as the physics
+            engine last saw it, and how far the shape reaches from it.
+        """
+        extents = self.extents
+        if extents is None:
+            extents = []
+            for tank in self.tanks_list:
+                bb = tank.shape.bb
+                extents.append((tank, (bb.left + bb.right) / 2,
+                                (bb.bottom + bb.top) / 2,
+                                math.hypot(bb.right - bb.left,
+                                           bb.top - bb.bottom) / 2 + MARGIN))
+            if self.caching:
+                self.extents = extents
+        return extents
+
+    def first_hit(self, tank):
+        """
+            Returns the game object a bullet shot by tank would hit first,
+            None if there is none or if it is a wall around the map.
+        """
+        if tank in self.hits:
+            return self.hits[tank]
+        body = tank.body
+        x, y = body.position
+        angle = body.angle
+        # Direction the tank is facing
+        dx = -math.sin(angle)
+        dy = math.cos(angle)
+        hit = None
+        if self.may_hit_target(tank, x, y, dx, dy):
+            res = self.space.segment_query_first(
+                (x + SIGHT_START * dx, y + SIGHT_START * dy),
+                (x + SIGHT_END * dx, y + SIGHT_END * dy), 0, SHAPE_FILTER)
+            if res is not None:
+                # The walls around the map are not game objects
+                hit = getattr(res.shape, "parent", None)
+        if self.caching:
+            self.hits[tank] = hit
+        return hit
+
+    def may_hit_target(self, tank, x, y, dx, dy):
+        """
+            Tells if the line of fire of tank, from (x, y) in the direction
+            (dx, dy), passes near a wooden box or another tank before the
+            first rock box. When it does not, the first thing hit is not
+            something the ai shoots at.
+        """
+        if self.map_version != self.currentmap.version:
+            self.update_near_targets()
+        end = self.walk(x, y, dx, dy)
+        if end is None:
+            return True
+        for other, cx, cy, reach in self.tank_extents():
+            if other is tank:
+                continue
+            cx -= x
+            cy -= y
+            along = cx * dx + cy * dy
+            if abs(cx * dy - cy * dx) <= reach and \
+               SIGHT_START - reach <= along <= end + reach:
+                return True
+        return False
+
+    def walk(self, x, y, dx, dy):
+        """
+            Walks the tiles crossed by the line of fire from (x, y) in the
+            direction (dx, dy). Returns None as soon as a tile near a wooden
+            box is crossed, otherwise the distance from (x, y) to the first
+            rock box or to the end of the line.
+        """
+        walls = self.walls
+        near_targets = self.near_targets
+        width = self.currentmap.width
+        height = self.currentmap.height
+        sx = x + SIGHT_START * dx
+        sy = y + SIGHT_START * dy
+        tile_x = math.floor(sx)
+        tile_y = math.floor(sy)
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        # Distance along the line to the next column and row of tiles, and
+        # between two columns and two rows
+        if dx != 0:
+            next_x = (tile_x + (dx > 0) - sx) / dx
+            delta_x = abs(1 / dx)
+        else:
+            next_x = delta_x = math.inf
+        if dy != 0:
+            next_y = (tile_y + (dy > 0) - sy) / dy
+            delta_y = abs(1 / dy)
+        else:
+            next_y = delta_y = math.inf
+        length = SIGHT_END - SIGHT_START
+        distance = 0
+        while distance <= length and 0 <= tile_x < width and \
+                0 <= tile_y < height:
+            if near_targets[tile_y][tile_x]:
+                return None
+            if walls[tile_y][tile_x]:
+                return SIGHT_START + distance + math.sqrt(2)
+            if next_x < next_y:
+                distance = next_x
+                next_x += delta_x
+                tile_x += step_x
+            else:
+                distance = next_y
+                next_y += delta_y
+                tile_y += step_y
+        return SIGHT_END
+
+    def update_near_targets(self):
+        """
+            Finds the tiles near a wooden box: its tile and the eight around
+            it, since a box can stick out of its tile when it is pushed.
+        """
+        targets = numpy.isin(self.currentmap.boxes, self.target_types)
+        near = numpy.zeros((targets.shape[0] + 2, targets.shape[1] + 2),
+                           dtype=bool)
+        for offset_y in range(3):
+            for offset_x in range(3):
+                near[offset_y:offset_y + targets.shape[0],
+                     offset_x:offset_x + targets.shape[1]] |= targets
+        self.near_targets = near[1:-1, 1:-1].tolist()
+        self.map_version = self.currentmap.version
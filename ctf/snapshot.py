@@ -0,0 +1,280 @@
+"""
+    The file contains the snapshots of a match: its whole state packed in a
+    compact buffer of bytes, which can be restored at any time to go back to
+    that state. It covers the physics bodies (position, velocity, angle),
+    the tanks, boxes, bullets, explosions and flag, the boxes of the map,
+    the score and the moves and paths of the ai. Snapshots are used for the
+    keyframes of the replays, and make it possible to roll a match back or
+    to try things out and come back.
+"""
+
+import math
+import struct
+
+import numpy
+from pymunk import Vec2d
+
+import gameobjects
+import images
+
+# The numbers kept by the main loop: tick, ticks until the next update of
+# the objects and tick of the first capture (-1 if none)
+COUNTERS = struct.Struct("<IBi")
+# Number of tanks, boxes and ai, which must be the ones of the match
+SIZES = struct.Struct("<HHH")
+COUNT = struct.Struct("<H")
+# x, y, orientation, is on a tank
+FLAG = struct.Struct("<ddd?")
+# Body (position, velocity, angle, angular velocity), acceleration, velocity,
+# angular acceleration, angular velocity, maximum speed, hp, cooldown,
+# respawn cooldown, carries the flag
+TANK = struct.Struct("<6d5dbHH?")
+# Is in the game, body, hp, tile
+BOX = struct.Struct("<?6dbhh")
+# Body, velocity, shooting angle
+BULLET = struct.Struct("<6d2d")
+# x, y, cooldown
+EXPLOSION = struct.Struct("<2db")
+# Step of the move, centre of the next tile, angle of the tank, target angle,
+# last distance, path is valid, target of the path, next tile, tile of the
+# tank, number of tiles in the path (which follow as pairs of shorts).
+# Tiles are (-1, -1) when there are none.
+AI = struct.Struct("<B2d3d?hhhhhhH")
+NO_TILE = (-1, -1)
+
+
+class Snapshotter:
+    """
+        Takes snapshots of a match and restores them. It is created once
+        with the objects of the match, which are then updated in place by a
+        restore: no object of the physics engine is created, only the
+        bullets and boxes are put back in or taken out of the space.
+    """
+
+    def __init__(self, space, game_objects, tanks_list, ai_list, boxes,
+                 flag, game_score, current_map, bullet_pool):
+        """
+            boxes is the list of all the movable boxes of the round, including
+            the destroyed ones, which can be brought back by a restore.
+        """
+        self.space          = space
+        self.game_objects   = game_objects
+        self.tanks_list     = tanks_list
+        self.ai_list        = ai_list
+        self.boxes          = boxes
+        self.flag           = flag
+        self.game_score     = game_score
+        self.current_map    = current_map
+        self.bullet_pool    = bullet_pool
+        self.score_format   = struct.Struct("<%dH" % len(game_score))
+
+    def capture(self, ticks, skip_update, first_capture_tick):
+        """ Returns the state of the match as bytes. """
+        parts = [COUNTERS.pack(ticks, skip_update,
+                               -1 if first_capture_tick is None
+                               else first_capture_tick),
+                 SIZES.pack(len(self.tanks_list), len(self.boxes),
+                            len(self.ai_list)),
+                 self.score_format.pack(*self.game_score),
+                 FLAG.pack(self.flag.x, self.flag.y, self.flag.orientation,
+                           self.flag.is_on_tank)]
+        for tank in self.tanks_list:
+            body = tank.body
+            position = body.position
+            velocity = body.velocity
+            parts.append(TANK.pack(
+                position.x, position.y, velocity.x, velocity.y, body.angle,
+                body.angular_velocity, tank.acceleration, tank.velocity,
+                tank.angular_acceleration, tank.angular_velocity,
+                tank.maximum_speed, tank.hp, tank.cooldown,
+                tank.respawn_cooldown, tank.flag is not None))
+
+        game_objects = self.game_objects
+        for box in self.boxes:
+            body = box.body
+            position = body.position
+            velocity = body.velocity
+            parts.append(BOX.pack(
+                box in game_objects, position.x, position.y, velocity.x,
+                velocity.y, body.angle, body.angular_velocity, box.hp,
+                box.tile[0], box.tile[1]))
+
+        bullets = game_objects.of_type(gameobjects.Bullet)
+        parts.append(COUNT.pack(len(bullets)))
+        for bullet in bullets:
+            body = bullet.body
+            position = body.position
+            velocity = body.velocity
+            parts.append(BULLET.pack(
+                position.x, position.y, velocity.x, velocity.y, body.angle,
+                body.angular_velocity, bullet.bullet_velocity,
+                bullet.shooting_angle))
+
+        explosions = game_objects.of_type(gameobjects.Explosion)
+        parts.append(COUNT.pack(len(explosions)))
+        for explosion in explosions:
+            parts.append(EXPLOSION.pack(explosion.x, explosion.y,
+                                        explosion.exp_cooldown))
+
+        parts.append(self.current_map.boxes.tobytes())
+
+        for ai_player in self.ai_list:
+            next_coord = ai_player.next_coord or (0, 0)
+            path = []
+            for tile in ai_player.path:
+                path.append(tile.x)
+                path.append(tile.y)
+            parts.append(AI.pack(
+                ai_player.move_step, next_coord[0], next_coord[1],
+                ai_player.angle_tank, ai_player.target_angle,
+                ai_player.last_distance, ai_player.path_valid,
+                *(ai_player.path_target or NO_TILE),
+                *(ai_player.next_tile or NO_TILE),
+                *ai_player.grid_pos.int_tuple, len(ai_player.path)))
+            parts.append(struct.pack("<%dh" % len(path), *path))
+        return b"".join(parts)
+
+    def restore(self, data):
+        """
+            Puts the match back in the state of a buffer returned by capture,
+            and returns the counters given to capture. Raises ValueError if
+            the buffer is not a snapshot of this match.
+        """
+        if len(data) < COUNTERS.size + SIZES.size:
+            raise ValueError("the snapshot is damaged")
+        ticks, skip_update, first_capture_tick = COUNTERS.unpack_from(data)
+        offset = COUNTERS.size
+        sizes = SIZES.unpack_from(data, offset)
+        offset += SIZES.size
+        if sizes != (len(self.tanks_list), len(self.boxes),
+                     len(self.ai_list)):
+            raise ValueError("the snapshot is from another match")
+        self.check_size(data)
+        self.game_score[:] = self.score_format.unpack_from(data, offset)
+        offset += self.score_format.size
+        flag = self.flag
+        flag.x, flag.y, flag.orientation, flag.is_on_tank = \
+            FLAG.unpack_from(data, offset)
+        offset += FLAG.size
+
+        for tank in self.tanks_list:
+            (x, y, velocity_x, velocity_y, angle, angular_velocity,
+             tank.acceleration, tank.velocity, tank.angular_acceleration,
+             tank.angular_velocity, tank.maximum_speed, tank.hp,
+             tank.cooldown, tank.respawn_cooldown, has_flag) = \
+                TANK.unpack_from(data, offset)
+            offset += TANK.size
+            set_body(tank.body, x, y, velocity_x, velocity_y, angle,
+                     angular_velocity)
+            tank.flag = flag if has_flag else None
+
+        game_objects = self.game_objects
+        space = self.space
+        restored = []
+        for box in self.boxes:
+            (alive, x, y, velocity_x, velocity_y, angle, angular_velocity,
+             box.hp, tile_x, tile_y) = BOX.unpack_from(data, offset)
+            offset += BOX.size
+            box.tile = (tile_x, tile_y)
+            set_body(box.body, x, y, velocity_x, velocity_y, angle,
+                     angular_velocity)
+            if alive and box not in game_objects:
+                restored.append(box)
+                space.add(box.body, box.shape)
+            elif not alive and box in game_objects:
+                game_objects.remove(box)
+                space.remove(box.shape, box.body)
+        # Put back at their place in the drawing order
+        game_objects.restore(restored)
+
+        for bullet in game_objects.of_type(gameobjects.Bullet):
+            game_objects.remove(bullet)
+            self.bullet_pool.release(bullet)
+        count, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        for i in range(count):
+            (x, y, velocity_x, velocity_y, angle, angular_velocity,
+             bullet_velocity, shooting_angle) = \
+                BULLET.unpack_from(data, offset)
+            offset += BULLET.size
+            sprite = images.rotate(images.bullet,
+                                   math.degrees(-shooting_angle))
+            bullet = self.bullet_pool.acquire(x, y, shooting_angle, sprite)
+            set_body(bullet.body, x, y, velocity_x, velocity_y, angle,
+                     angular_velocity)
+            bullet.bullet_velocity = bullet_velocity
+            game_objects.add(bullet)
+
+        for explosion in game_objects.of_type(gameobjects.Explosion):
+            game_objects.remove(explosion)
+        count, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        for i in range(count):
+            x, y, exp_cooldown = EXPLOSION.unpack_from(data, offset)
+            offset += EXPLOSION.size
+            explosion = gameobjects.Explosion(x, y, 0, images.explosion, space)
+            explosion.exp_cooldown = exp_cooldown
+            game_objects.add(explosion)
+
+        current_map = self.current_map
+        size = current_map.boxes.size
+        current_map.boxes[...] = numpy.frombuffer(
+            data, current_map.boxes.dtype, size, offset).reshape(
+                current_map.boxes.shape)
+        offset += size
+        # Everything computed from the boxes of the map is outdated
+        current_map.version += 1
+
+        for ai_player in self.ai_list:
+            (ai_player.move_step, next_x, next_y, ai_player.angle_tank,
+             ai_player.target_angle, ai_player.last_distance,
+             ai_player.path_valid, target_x, target_y, tile_x, tile_y,
+             grid_x, grid_y, length) = AI.unpack_from(data, offset)
+            offset += AI.size
+            path = struct.unpack_from("<%dh" % (2 * length), data, offset)
+            offset += 4 * length
+            ai_player.next_coord = Vec2d(next_x, next_y)
+            ai_player.path_target = \
+                None if target_x == -1 else (target_x, target_y)
+            ai_player.next_tile = None if tile_x == -1 else (tile_x, tile_y)
+            ai_player.grid_pos = Vec2d(grid_x, grid_y)
+            ai_player.path.clear()
+            ai_player.path.extend(Vec2d(path[i], path[i + 1])
+                                  for i in range(0, len(path), 2))
+            # A search started before the restore would replace the path
+            ai_player.cancel_search()
+
+        return (ticks, skip_update,
+                None if first_capture_tick == -1 else first_capture_tick)
+
+    def check_size(self, data):
+        """
+            Raises ValueError if data is not as long as a snapshot of this
+            match with the numbers of bullets, explosions and tiles of paths
+            it gives, so that a restore never reads past it or reads one
+            part as another.
+        """
+        offset = (COUNTERS.size + SIZES.size + self.score_format.size
+                  + FLAG.size + TANK.size * len(self.tanks_list)
+                  + BOX.size * len(self.boxes))
+        for record in (BULLET, EXPLOSION):
+            if offset + COUNT.size > len(data):
+                raise ValueError("the snapshot is damaged")
+            count, = COUNT.unpack_from(data, offset)
+            offset += COUNT.size + count * record.size
+        offset += self.current_map.boxes.nbytes
+        for ai_player in self.ai_list:
+            if offset + AI.size > len(data):
+                raise ValueError("the snapshot is damaged")
+            length = AI.unpack_from(data, offset)[-1]
+            offset += AI.size + 4 * length
+        if offset != len(data):
+            raise ValueError("the snapshot is damaged")
+
+
+def set_body(body, x, y, velocity_x, velocity_y, angle, angular_velocity):
+    """ Sets the position, velocity, angle and angular velocity of a body. """
+    body.position = x, y
+    body.velocity = velocity_x, velocity_y
+    body.angle = angle
+    body.angular_velocity = angular_velocity
@@ -1,9 +1,25 @@
-"""The file initiaizes sound."""
+"""
+    The file initiaizes sound. The mixer is started and each sound is loaded
+    the first time a sound is used.
+"""
 import pygame
 import os
 
-pygame.mixer.init()
+import assets
 
-wood_destruction = pygame.mixer.Sound("sound/Wood.wav")
-shoot = pygame.mixer.Sound("sound/Shoot.wav")
-victory = pygame.mixer.Sound("sound" + os.sep + "Victory_new.wav")
+main_dir = os.path.split(os.path.abspath(__file__))[0]
+
+
+def loader(file):
+    """ Returns a function that loads a sound of the sound folder. """
+    def load():
+        if pygame.mixer.get_init() is None:
+            pygame.mixer.init()
+        return pygame.mixer.Sound(os.path.join(main_dir, "sound", file))
+    return load
+
+
+__getattr__ = assets.lazy_module(globals(), {
+    "wood_destruction": loader("Wood.wav"),
+    "shoot": loader("Shoot.wav"),
+    "victory": loader("Victory_new.wav")})
@@ -0,0 +1,165 @@
+"""
+    The file contains the sprite cache: the sprites of the game prepared in
+    advance (scaled, rotated at every step of images.ROTATION_STEP and in
+    the pixel format of the display) and stored in data/sprites.cache. The
+    file is mapped in memory when a sprite is first used, and the sprites
+    are surfaces that read their pixels from it, so loading them decodes
+    nothing and only the rotations that are drawn are read from the disk.
+
+    Each sprite is stored with a hash of its image file and of how it is
+    prepared, a sprite whose image changed is prepared at runtime until the
+    cache is built again with:
+        python3 spritecache.py
+"""
+
+import json
+import mmap
+import os
+import struct
+
+import pygame
+
+MAGIC = b"CTFS"
+VERSION = 1
+# magic, version, length of the index, number of rotations in the table
+HEADER = struct.Struct("<4sBII")
+# Width, height and offset in the pixels of a rotation
+ROTATION = struct.Struct("<HHI")
+# The pixels are stored as bytes in the order B, G, R, A, which is the
+# format of the surfaces returned by convert_alpha on most displays
+PIXEL_FORMAT = "BGRA"
+MASKS = (0xff0000, 0xff00, 0xff, 0xff000000)
+
+main_dir = os.path.split(os.path.abspath(__file__))[0]
+CACHE_FILE = os.path.join(main_dir, "data", "sprites.cache")
+
+
+class SpriteCache:
+    """
+        A sprite cache file, mapped in memory. It is made of the header, an
+        index in JSON with the key of each sprite and where its rotations
+        are in the table, the table of the rotations and their pixels.
+    """
+
+    def __init__(self, path=CACHE_FILE):
+        """ Raises OSError if there is no file and ValueError if it is not
+            a sprite cache of this version. """
+        with open(path, "rb") as file_handle:
+            self.data = mmap.mmap(file_handle.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        magic, version, length, count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('"%s" is not a sprite cache of this version'
+                             % path)
+        offset = HEADER.size
+        self.index = json.loads(self.data[offset:offset + length])
+        offset += length
+        self.table = memoryview(self.data)[offset:offset
+                                           + count * ROTATION.size]
+        self.pixels = memoryview(self.data)[offset + count * ROTATION.size:]
+
+    def rotations(self, name, key):
+        """
+            Returns the rotations of the sprite name, starting with the sprite
+            itself, or None if the cache does not have it or has it for
+            another key.
+        """
+        entry = self.index.get(name)
+        if entry is None or entry["key"] != key:
+            return None
+        return Rotations(self, entry["first"], entry["count"])
+
+    def surface(self, rotation):
+        """ Returns a surface of the pixels of a rotation of the table. """
+        width, height, offset = ROTATION.unpack_from(
+            self.table, rotation * ROTATION.size)
+        return pygame.image.frombuffer(
+            self.pixels[offset:offset + width * height * 4], (width, height),
+            PIXEL_FORMAT)
+
+
+class Rotations:
+    """
+        The rotations of a sprite in a sprite cache, by step of
+        images.ROTATION_STEP degrees. Each rotation is made into a surface
+        the first time it is read.
+    """
+
+    def __init__(self, cache, first, count):
+        self.cache          = cache
+        self.first          = first
+        self.surfaces       = [None] * count
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def __getitem__(self, step):
+        surface = self.surfaces[step]
+        if surface is None:
+            surface = self.cache.surface(self.first + step)
+            self.surfaces[step] = surface
+        return surface
+
+
+def write(sprites, path=CACHE_FILE):
+    """
+        Writes a sprite cache, sprites gives for each name the key and the
+        list of rotations of the sprite.
+    """
+    index = {}
+    table = []
+    pixels = []
+    offset = 0
+    for name, (key, rotations) in sprites.items():
+        index[name] = {"key": key, "first": len(table),
+                       "count": len(rotations)}
+        for surface in rotations:
+            data = pygame.image.tobytes(surface, PIXEL_FORMAT)
+            table.append(ROTATION.pack(surface.get_width(),
+                                       surface.get_height(), offset))
+            pixels.append(data)
+            offset += len(data)
+    index = json.dumps(index).encode()
+    # Written next to the cache then renamed, so that a running game never
+    # maps a file that is only partly written
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file_handle:
+        file_handle.write(HEADER.pack(MAGIC, VERSION, len(index), len(table)))
+        file_handle.write(index)
+        file_handle.write(b"".join(table))
+        for data in pixels:
+            file_handle.write(data)
+    os.replace(temporary, path)
+
+
+def build(path=CACHE_FILE):
+    """ Prepares every sprite of images.SPRITES and writes the cache. """
+    import images
+    if images.pixel_format() != MASKS:
+        raise SystemExit("The display uses another pixel format, the "
+                         "sprites can not be cached.")
+    sprites = {}
+    for name in images.SPRITES:
+        sprite = images.prepare(name)
+        rotations = [sprite]
+        if images.SPRITES[name][3]:
+            steps = 360 // images.ROTATION_STEP
+            rotations += [pygame.transform.rotate(sprite,
+                                                  step * images.ROTATION_STEP)
+                          for step in range(1, steps)]
+        sprites[name] = (images.sprite_key(name), rotations)
+    write(sprites, path)
+    return sprites
+
+
+if __name__ == "__main__":
+    # The sprites are converted to the format of the display, which needs
+    # a display, but not a window
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    sprites = build()
+    print("Cached %d sprites and %d rotations in %s (%d KB)"
+          % (len(sprites), sum(len(rotations) for key, rotations
+                               in sprites.values()),
+             CACHE_FILE, os.path.getsize(CACHE_FILE) // 1024))
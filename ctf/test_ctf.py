@@ -0,0 +1,58 @@
+"""
+    The file contains tests of the rounds of ctf.py, played headless. Run
+    them from the ctf folder with python -m pytest.
+"""
+
+import contextlib
+import io
+import os
+import runpy
+import sys
+import unittest
+
+main_dir = os.path.split(os.path.abspath(__file__))[0]
+
+
+def load_game(*arguments):
+    """
+        Sets up a headless match with the options of ctf.py, without
+        playing it, and returns the globals of ctf.py.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    argv = sys.argv
+    sys.argv = ["ctf.py", "--headless", "--ticks", "0"] + list(arguments)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return runpy.run_path(os.path.join(main_dir, "ctf.py"))
+    finally:
+        sys.argv = argv
+
+
+class ResetBoxesTest(unittest.TestCase):
+    """ Tests that a new round is laid out like the first one. """
+
+    def test_draw_order(self):
+        game = load_game("--map", "map0")
+        game_objects = game["game_objects"]
+        start = game_objects.in_order(game_objects)
+        boxes = [box for box in game["movable_box_list"]
+                 if box.boxmodel.destructable]
+        self.assertTrue(boxes)
+        for box in boxes[::2]:
+            for i in range(3):
+                game["damaged_woodbox"](box.shape)
+        for box in boxes[::2]:
+            self.assertNotIn(box, game_objects)
+
+        game["reset_boxes"]()
+        # Explosions are not part of the round
+        end = [obj for obj in game_objects.in_order(game_objects)
+               if not isinstance(obj, game["gameobjects"].Explosion)]
+        self.assertEqual(start, end)
+        self.assertEqual(start, [obj for obj in game_objects
+                                 if obj in start])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+    The file contains the timing of the frames: how long every phase of a
+    frame takes (reading the events, the ai, the physics, drawing...), so
+    that when the game stutters, the phase responsible can be found. The
+    percentiles of the last frames can be shown over the game, and the time
+    of every frame can be written to a CSV or JSON lines file.
+"""
+
+import collections
+import json
+import time
+
+import pygame
+
+# The phases of a frame, in the order they are shown
+PHASES = ("events", "replay", "flag_checks", "update", "explosions", "step",
+          "post_update", "decide", "render", "flip", "tick")
+WINDOW = 300               # Number of frames the percentiles are taken from
+PERCENTILES = (50, 95, 99)
+REFRESH = 15               # Frames between two updates of the overlay
+FONT_SIZE = 12
+
+# The font of the overlay, loaded the first time it is shown
+font = None
+
+
+class FrameTimer:
+    """
+        Measures the time spent in each phase of the frames. The main loop
+        calls lap with the name of a phase when that phase is over, the time
+        since the previous lap is then counted for that phase. A phase can
+        happen several times in a frame (once per tick), the times then add
+        up. end_frame is called once the frame is drawn.
+    """
+
+    def __init__(self, output=None):
+        """
+            output is the path of a file where the time of every frame is
+            written, as JSON lines if it ends with .jsonl and as CSV
+            otherwise.
+        """
+        self.current        = dict.fromkeys(PHASES, 0.0)
+        # The last WINDOW times of each phase and of the whole frame, in ms
+        self.history        = {phase: collections.deque(maxlen=WINDOW)
+                               for phase in PHASES + ("frame",)}
+        self.last           = time.perf_counter()
+        self.frames         = 0
+        self.overlay        = None
+        self.file_handle    = None
+        self.jsonl          = False
+        if output is not None:
+            self.file_handle = open(output, "w")
+            self.jsonl = output.endswith(".jsonl")
+            if not self.jsonl:
+                self.file_handle.write(",".join(("frame", "ticks") + PHASES
+                                                + ("total",)) + "\n")
+
+    def start(self):
+        """ Starts timing a frame from now. """
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        """ Counts the time since the last lap for phase. """
+        now = time.perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def skip(self):
+        """
+            Leaves out the time since the last lap, for instance the time
+            spent on the score screen.
+        """
+        self.last = time.perf_counter()
+
+    def end_frame(self, ticks):
+        """ Ends the frame, ticks is the number of ticks run so far. """
+        times = {phase: seconds * 1000
+                 for phase, seconds in self.current.items()}
+        total = sum(times.values())
+        for phase, milliseconds in times.items():
+            self.history[phase].append(milliseconds)
+        self.history["frame"].append(total)
+        if self.file_handle is not None:
+            if self.jsonl:
+                times["frame"] = self.frames
+                times["ticks"] = ticks
+                times["total"] = total
+                self.file_handle.write(json.dumps(times) + "\n")
+            else:
+                self.file_handle.write("%d,%d,%s,%.4f\n" % (
+                    self.frames, ticks,
+                    ",".join("%.4f" % times[phase] for phase in PHASES),
+                    total))
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.frames += 1
+
+    def percentiles(self, phase):
+        """ Returns the PERCENTILES of the last times of phase, in ms. """
+        values = sorted(self.history[phase])
+        if not values:
+            return [0.0] * len(PERCENTILES)
+        return [values[min(len(values) - 1, len(values) * p // 100)]
+                for p in PERCENTILES]
+
+    def draw(self, screen):
+        """
+            Draws the percentiles over the top left corner of the screen and
+            returns the rectangle covered. The text is only rendered again
+            every REFRESH frames.
+        """
+        global font
+        if font is None:
+            font = pygame.font.Font('freesansbold.ttf', FONT_SIZE)
+        if self.overlay is None or self.frames % REFRESH == 0:
+            white = (255, 255, 255)
+            rows = [["ms"] + ["p%d" % p for p in PERCENTILES]]
+            for phase in PHASES + ("frame",):
+                rows.append([phase] + ["%.2f" % value
+                                       for value in self.percentiles(phase)])
+            line_height = font.get_linesize()
+            self.overlay = pygame.Surface((90 + 55 * len(PERCENTILES),
+                                           line_height * len(rows) + 8))
+            for i, row in enumerate(rows):
+                y = 4 + i * line_height
+                self.overlay.blit(font.render(row[0], True, white), (4, y))
+                # The numbers are aligned on the right of their column
+                for j, cell in enumerate(row[1:]):
+                    text = font.render(cell, True, white)
+                    self.overlay.blit(text, (90 + 55 * (j + 1)
+                                             - text.get_width() - 4, y))
+        return screen.blit(self.overlay, (0, 0))
+
+    def close(self):
+        """ Closes the output file. """
+        if self.file_handle is not None:
+            self.file_handle.close()
+
+
+class NullTimer:
+    """
+        Stands for a FrameTimer when the frames are not timed (no output
+        file and no overlay), so that the main loop does not spend time
+        measuring them.
+    """
+
+    def start(self):
+        return
+
+    def lap(self, phase):
+        return
+
+    def skip(self):
+        return
+
+    def end_frame(self, ticks):
+        return
+
+    def close(self):
+        return
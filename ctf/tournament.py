@@ -0,0 +1,163 @@
+"""
+    The file runs a tournament: many headless matches of ctf.py over a set of
+    maps and seeds, played in parallel on all the cores of the computer, and
+    prints a report of the results.
+
+    Example: python3 tournament.py --maps map0 map1 --seeds 0-19 --ticks 20000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import runpy
+import statistics
+import sys
+import time
+
+import maps
+
+main_dir = os.path.split(os.path.abspath(__file__))[0]
+
+
+def parse_seeds(text):
+    """ Reads seeds given as a list of numbers and ranges, like "0-9,15". """
+    seeds = []
+    for part in text.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            seeds.extend(range(int(first), int(last) + 1))
+        else:
+            seeds.append(int(part))
+    return seeds
+
+
+def map_path(name):
+    """
+        Loads the map name (see maps.load), which raises OSError or
+        ValueError if it can not be played, and returns where ctf.py finds
+        it: the path of a map file is made absolute, since the matches are
+        played from the ctf folder.
+    """
+    maps.load(name)
+    if os.path.dirname(name) != "" or os.path.exists(name):
+        return os.path.abspath(name)
+    return name
+
+
+def play_match(match):
+    """
+        Plays one headless match of ctf.py and returns its results. Each match
+        runs in its own process, since ctf.py sets up the game when it is run.
+    """
+    map_name, path, seed, ticks, rounds = match
+    sys.argv = ["ctf.py", "--headless", "--map", path, "--seed", str(seed),
+                "--ticks", str(ticks)]
+    if rounds is not None:
+        sys.argv += ["--rounds", str(rounds)]
+    start = time.perf_counter()
+    # ctf.py prints the score after every capture
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = runpy.run_path(os.path.join(main_dir, "ctf.py"))
+    seconds = time.perf_counter() - start
+    return {"map": map_name,
+            "seed": seed,
+            "game_score": game["game_score"],
+            "captures": sum(game["game_score"]),
+            "ticks": game["ticks"],
+            "first_capture_tick": game["first_capture_tick"],
+            "seconds": seconds}
+
+
+def summarize(results):
+    """ Aggregates the results of the matches, for each map and in total. """
+    summary = {}
+    maps = sorted(set(result["map"] for result in results))
+    for map_name in maps + [None]:
+        matches = [result for result in results
+                   if map_name is None or result["map"] == map_name]
+        first_captures = [match["first_capture_tick"] for match in matches
+                          if match["first_capture_tick"] is not None]
+        wins = {}
+        for match in matches:
+            for player, captures in enumerate(match["game_score"]):
+                wins[player + 1] = wins.get(player + 1, 0) + captures
+        ticks = sum(match["ticks"] for match in matches)
+        seconds = sum(match["seconds"] for match in matches)
+        summary[map_name or "all"] = {
+            "matches": len(matches),
+            "captures": sum(match["captures"] for match in matches),
+            "captures_per_match":
+                statistics.mean(match["captures"] for match in matches),
+            "matches_without_capture": len(matches) - len(first_captures),
+            "median_ticks_to_first_capture":
+                statistics.median(first_captures) if first_captures else None,
+            "mean_ticks_to_first_capture":
+                statistics.mean(first_captures) if first_captures else None,
+            "captures_per_player": wins,
+            "ticks_per_second": ticks / seconds if seconds else None}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs many headless matches "
+                                     "in parallel and reports the results.")
+    parser.add_argument("--maps", nargs="+", default=["map0", "map1", "map2"],
+                        help="Names of maps of the ctf folder or paths of "
+                             "map files (default map0 map1 map2).")
+    parser.add_argument("--seeds", type=parse_seeds, default=parse_seeds("0-7"),
+                        help="Seeds of the matches, like 0-9,15 (default 0-7).")
+    parser.add_argument("--ticks", type=int, default=20000,
+                        help="Length of a match in ticks (default 20000).")
+    parser.add_argument("--rounds", type=int, default=None,
+                        help="Stop a match after this many captured flags.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="Number of matches played at the same time "
+                             "(default: the number of cores).")
+    parser.add_argument("--output", default=None,
+                        help="Write the report as JSON to this file.")
+    args = parser.parse_args()
+    map_paths = []
+    for name in args.maps:
+        try:
+            map_paths.append(map_path(name))
+        except (OSError, ValueError) as error:
+            parser.error("can not load the map %s: %s" % (name, error))
+
+    # ctf.py and the modules it imports load their files from this folder
+    os.chdir(main_dir)
+    matches = [(map_name, path, seed, args.ticks, args.rounds)
+               for map_name, path in zip(args.maps, map_paths)
+               for seed in args.seeds]
+
+    start = time.perf_counter()
+    results = []
+    # A new process for every match, since a match changes the state of the
+    # modules it uses (the boxes of the map for instance)
+    with multiprocessing.Pool(args.processes, maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(play_match, matches):
+            results.append(result)
+            print("%s seed %d: score %s, first capture at tick %s"
+                  % (result["map"], result["seed"], result["game_score"],
+                     result["first_capture_tick"]), file=sys.stderr)
+    seconds = time.perf_counter() - start
+
+    results.sort(key=lambda result: (result["map"], result["seed"]))
+    report = {"matches": results,
+              "summary": summarize(results),
+              "processes": args.processes,
+              "seconds": seconds,
+              # How much faster than playing the matches one after the other
+              "speedup": sum(result["seconds"] for result in results)
+              / seconds}
+    text = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as file_handle:
+            file_handle.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()